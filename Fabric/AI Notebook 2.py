@@ -9,7 +9,7 @@
 
 
 # The command is not a standard IPython magic command. It is designed for use within Fabric notebooks only.
-# %pip install -q -U semantic-link-labs google-genai anthropic typing_extensions pydantic
+# %pip install -q -U semantic-link-labs google-genai anthropic typing_extensions pydantic orjson
 
 
 # In[2]:
@@ -19,20 +19,26 @@
 import sempy
 import sempy_labs
 import sempy.fabric as fabric
-from pyspark.sql import SparkSession, functions as F
+from pyspark import StorageLevel
+from pyspark.sql import SparkSession, DataFrame as SparkDataFrame, functions as F
 from pyspark.sql.functions import col
+from pyspark.sql.types import StructType, StructField, StringType, LongType
 from google import genai
 from google.genai import types
 import pandas as pd
 import numpy as np
 import anthropic
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field, fields
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime
-import time
-import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import orjson
 import os
 import re
+from pathlib import Path
+from string import Template
 
 # Initialize Spark session
 spark = SparkSession.builder.getOrCreate()
@@ -80,11 +86,32 @@ DATATYPE_MAPPING = {
     'Unknown': 'VARCHAR(255)'
 }
 
+# Keyword fallback for types not in DATATYPE_MAPPING; one named group per category.
+# The lookahead lets a single finditer pass see overlapping keywords at every position.
+_TSQL_TYPE_RE = re.compile(
+    r'(?=(?P<int>int|whole)|(?P<numeric>numeric|number|currency)|(?P<float>double|float)'
+    r'|(?P<text>text|string)|(?P<date>date)|(?P<time>time)|(?P<bool>bool))'
+)
+
+# Newline for joins inside f-string expressions (backslashes aren't allowed there before 3.12)
+NL = '\n'
+
+# Lakehouse folders already created in this run (each makedirs is a round-trip on the Files mount);
+# reset by every run_complete_migration, since folders can be deleted between runs
+_created_dirs = set()
+
+
+def _ensure_dir(path: str):
+    """os.makedirs(path, exist_ok=True), skipped for folders this run already created"""
+    if path not in _created_dirs:
+        os.makedirs(path, exist_ok=True)
+        _created_dirs.add(path)
+
 
 # In[4]:
 
 
-@dataclass
+@dataclass(slots=True)
 class ColumnSpec:
     """Column specification for T-SQL generation"""
     column_name: str
@@ -97,7 +124,7 @@ class ColumnSpec:
     referenced_column: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class TableSpec:
     """Table specification for T-SQL generation"""
     table_name: str
@@ -107,7 +134,7 @@ class TableSpec:
     usage_metrics: Dict
 
 
-@dataclass
+@dataclass(slots=True)
 class DatasetMigrationSpec:
     """Complete dataset migration specification"""
     dataset_id: str
@@ -119,9 +146,11 @@ class DatasetMigrationSpec:
     excluded_columns: int
     excluded_measures: int
     total_relationships: int
+    tables_count: int = 0
+    columns_count: int = 0
 
 
-@dataclass
+@dataclass(slots=True)
 class MCodeExpression:
     """Represents a single M code expression from a dataset"""
     dataset_id: str
@@ -133,19 +162,22 @@ class MCodeExpression:
     expression_type: str
     object_name: Optional[str] = None
     column_name: Optional[str] = None
+    _context: Optional[str] = field(default=None, init=False, repr=False, compare=False)
     
     def get_context(self) -> str:
-        """Get a formatted context string for AI prompts"""
-        return f"""
+        """Get a formatted context string for AI prompts (rendered on first call)"""
+        if self._context is None:
+            self._context = f"""
 Dataset: {self.dataset_name}
 Workspace: {self.workspace_name}
 Table: {self.table_name}
 Expression Type: {self.expression_type}
 Object: {self.object_name or 'N/A'}
 """
+        return self._context
 
 
-@dataclass
+@dataclass(slots=True)
 class MCodeExtractionResult:
     """Results from M code extraction"""
     dataset_id: str
@@ -160,14 +192,43 @@ class MCodeExtractionResult:
 # In[7]:
 
 
+# Instructions shared by every CREATE TABLE prompt, sent as the system prompt so each per-dataset prompt carries only its data
+_TSQL_SYSTEM_PROMPT = """You are an expert SQL developer specializing in dimensional modeling. Generate T-SQL CREATE TABLE scripts for Power BI dataset migration.
+
+IMPORTANT CONSTRAINTS:
+1. Use EXACT column names as provided (case-sensitive)
+2. Use the EXACT T-SQL data types specified
+3. Only include tables and columns listed below
+4. Add comments for each table and column documenting the original Power BI context. for example:
+``----------------------------------------------------------------------------------------------------
+-- Table: States
+-- Description: Represents geographical states, likely within the US, providing demographic and environmental data.
+-- Usage in Power BI: 0 measures, 2 relationships
+----------------------------------------------------------------------------------------------------
+CREATE TABLE [States] (
+    [Average Temperature ] FLOAT, -- The average temperature recorded for the state.
+    [Flag] VARCHAR(255),         -- A flag or indicator associated with the state, possibly for categorization or status.
+    [Population] FLOAT,          -- The total population of the state.
+    [State] VARCHAR(255)         -- The name of the state.
+);``
+
+5. Do NOT include PRIMARY KEY constraints
+6. Do NOT include FOREIGN KEY constraints
+7. Do NOT include INDEX definitions
+8. Return the T-SQL script as a valid SQL file ready to be saved in lakehouse as .sql"""
+
+
 class TSQLMigrationPrep:
     """Prepares Power BI datasets for T-SQL migration"""
     
-    def __init__(self, lakehouse: Optional[str] = None, api_key: Optional[str] = None, agent_mode: Optional[str] = None):
+    def __init__(self, lakehouse: Optional[str] = None, api_key: Optional[str] = None, agent_mode: Optional[str] = None,
+                 max_concurrent_requests: int = 8):
         self.lakehouse = lakehouse
         self.api_key = api_key
         self.agent_mode = agent_mode
         self.client = None
+        # Shared by every thread that calls complete_prompt; replaces the fixed sleep between datasets
+        self._ai_slots = threading.BoundedSemaphore(max(1, max_concurrent_requests))
 
         if api_key and agent_mode:
             if agent_mode == "claude":
@@ -181,31 +242,18 @@ class TSQLMigrationPrep:
         self.table_analysis_df = pd.DataFrame()
         self.dataset_analysis_df = pd.DataFrame()
         self.relationships_df = pd.DataFrame()
+        self._index_loaded_data()
         
         print("✅ T-SQL Migration Prep initialized")
     
-    def _make_json_safe(self, obj):
-        """Recursively converts any object into JSON-serializable types."""
-        if isinstance(obj, dict):
-            return {k: self._make_json_safe(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [self._make_json_safe(v) for v in obj]
-        elif isinstance(obj, (datetime, pd.Timestamp)):
+    @staticmethod
+    def _json_default(obj):
+        """orjson fallback for the types it doesn't serialize natively."""
+        if isinstance(obj, (datetime, pd.Timestamp)):
             return obj.isoformat()
-        elif isinstance(obj, (np.integer, int)):
-            return int(obj)
-        elif isinstance(obj, (np.floating, float)):
-            return float(obj)
         elif isinstance(obj, set):
             return list(obj)
-        elif obj is None:
-            return None
-        else:
-            try:
-                json.dumps(obj)
-                return obj
-            except Exception:
-                return str(obj)
+        return str(obj)
     
     def load_lakehouse_data(self, 
                            column_usage_df: pd.DataFrame,
@@ -216,37 +264,95 @@ class TSQLMigrationPrep:
         print("\n📥 Loading lakehouse analysis data...")
         
         self.column_usage_df = column_usage_df
+        if 'data_type' in column_usage_df.columns:
+            # Map each distinct Power BI type once, then broadcast over every column row
+            codes, distinct_types = pd.factorize(column_usage_df['data_type'], use_na_sentinel=False)
+            tsql_by_code = np.array([self.map_datatype_to_tsql(t) for t in distinct_types], dtype=object)
+            self.column_usage_df = column_usage_df.assign(tsql_data_type=tsql_by_code[codes])
         self.table_analysis_df = table_analysis_df
         self.dataset_analysis_df = dataset_analysis_df if dataset_analysis_df is not None else pd.DataFrame()
         self.relationships_df = relationships_df if relationships_df is not None else pd.DataFrame()
         
+        # Table names repeat on every column/relationship row, store them as categories
+        self.column_usage_df = self._as_category(self.column_usage_df, ['table_name'])
+        self.table_analysis_df = self._as_category(self.table_analysis_df, ['table_name'])
+        self.relationships_df = self._as_category(self.relationships_df, ['from_table', 'to_table'])
+        
         print(f"  ✅ Loaded {len(self.column_usage_df)} column records")
         print(f"  ✅ Loaded {len(self.table_analysis_df)} table records")
         print(f"  ✅ Loaded {len(self.dataset_analysis_df)} dataset records")
         print(f"  ✅ Loaded {len(self.relationships_df)} relationship records")
+        
+        self._index_loaded_data()
+    
+    @staticmethod
+    def _as_category(df: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+        """Return df with the given (present, not yet categorical) columns cast to category"""
+        to_cast = {
+            c: df[c].astype('category') for c in columns
+            if c in df.columns and not isinstance(df[c].dtype, pd.CategoricalDtype)
+        }
+        return df.assign(**to_cast) if to_cast else df
+    
+    @staticmethod
+    def _group_by_dataset(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+        """Split a frame into {dataset_id: rows} (empty dict if there is nothing to split)"""
+        if df.empty or 'dataset_id' not in df.columns:
+            return {}
+        return dict(list(df.groupby('dataset_id', sort=False)))
     
-    def map_datatype_to_tsql(self, pbi_datatype: str) -> str:
-        """Map Power BI data type to T-SQL data type"""
+    def _index_loaded_data(self):
+        """Build the per-dataset and per-table lookups used by prepare_dataset_migration"""
+        self.tables_by_ds = self._group_by_dataset(self.table_analysis_df)
+        self.columns_by_ds = self._group_by_dataset(self.column_usage_df)
+        self.datasets_by_ds = self._group_by_dataset(self.dataset_analysis_df)
+        self.rels_by_ds = self._group_by_dataset(self.relationships_df)
+        self._rels_empty = self.relationships_df.empty
+        
+        # Relationships are matched on table names only, across all datasets
+        self.rels_from_by_table = {}
+        self.rels_to_by_table = {}
+        self._fk_index: Dict[Tuple[str, str], Tuple[str, str]] = {}
+        
+        if not self._rels_empty:
+            self.rels_from_by_table = dict(list(self.relationships_df.groupby('from_table', sort=False, observed=True)))
+            self.rels_to_by_table = dict(list(self.relationships_df.groupby('to_table', sort=False, observed=True)))
+            
+            rels = self.relationships_df
+            n_rels = len(rels)
+            to_tables = rels['to_table'].tolist() if 'to_table' in rels.columns else [''] * n_rels
+            to_columns = rels['to_column'].tolist() if 'to_column' in rels.columns else [''] * n_rels
+            # First relationship wins for each (from_table, from_column), same as the old mask + iloc[0]
+            for fk_key, fk_target in zip(
+                zip(rels['from_table'].tolist(), rels['from_column'].tolist()),
+                zip(to_tables, to_columns)
+            ):
+                self._fk_index.setdefault(fk_key, fk_target)
+    
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def map_datatype_to_tsql(pbi_datatype: str) -> str:
+        """Map Power BI data type to T-SQL data type (cached, the same few types repeat per column)"""
         pbi_datatype = str(pbi_datatype).strip()
         
         if pbi_datatype in DATATYPE_MAPPING:
             return DATATYPE_MAPPING[pbi_datatype]
         
-        pbi_lower = pbi_datatype.lower()
+        found = {m.lastgroup for m in _TSQL_TYPE_RE.finditer(pbi_datatype.lower())}
         
-        if 'int' in pbi_lower or 'whole' in pbi_lower:
+        if 'int' in found:
             return 'INT'
-        elif 'NUMERIC' in pbi_lower or 'number' in pbi_lower or 'currency' in pbi_lower:
+        elif 'numeric' in found:
             return 'NUMERIC(18, 2)'
-        elif 'double' in pbi_lower or 'float' in pbi_lower:
+        elif 'float' in found:
             return 'FLOAT'
-        elif 'text' in pbi_lower or 'string' in pbi_lower:
+        elif 'text' in found:
             return 'VARCHAR(255)'
-        elif 'date' in pbi_lower:
-            if 'time' in pbi_lower:
+        elif 'date' in found:
+            if 'time' in found:
                 return 'DATETIME2'
             return 'DATE'
-        elif 'bool' in pbi_lower:
+        elif 'bool' in found:
             return 'BIT'
         else:
             return 'VARCHAR(255)'
@@ -256,13 +362,15 @@ class TSQLMigrationPrep:
         print(f"\n🔄 Preparing specs for dataset: {dataset_id}")
         
         # Get dataset info
+        dataset_tables = self.tables_by_ds.get(dataset_id, self.table_analysis_df.iloc[0:0])
+        dataset_columns = self.columns_by_ds.get(dataset_id, self.column_usage_df.iloc[0:0])
+        
         if not self.dataset_analysis_df.empty:
-            dataset_row = self.dataset_analysis_df[self.dataset_analysis_df['dataset_id'] == dataset_id]
-            if dataset_row.empty:
+            dataset_row = self.datasets_by_ds.get(dataset_id)
+            if dataset_row is None:
                 raise ValueError(f"Dataset {dataset_id} not found")
             dataset_info = dataset_row.iloc[0]
         else:
-            dataset_tables = self.table_analysis_df[self.table_analysis_df['dataset_id'] == dataset_id]
             if dataset_tables.empty:
                 raise ValueError(f"Dataset {dataset_id} not found")
             dataset_info = {
@@ -276,26 +384,12 @@ class TSQLMigrationPrep:
         workspace_name = dataset_info.get('workspace_name', '')
         
         # Filter to used tables and columns
-        used_tables_df = self.table_analysis_df[
-            (self.table_analysis_df['dataset_id'] == dataset_id) &
-            (self.table_analysis_df['is_used'] == True)
-        ]
-        
-        used_columns_df = self.column_usage_df[
-            (self.column_usage_df['dataset_id'] == dataset_id) &
-            (self.column_usage_df['is_used'] == True)
-        ]
+        used_tables_df = dataset_tables[dataset_tables['is_used'] == True]
+        used_columns_df = dataset_columns[dataset_columns['is_used'] == True]
         
         # Get excluded counts
-        unused_tables = self.table_analysis_df[
-            (self.table_analysis_df['dataset_id'] == dataset_id) &
-            (self.table_analysis_df['is_used'] == False)
-        ]
-        
-        unused_columns = self.column_usage_df[
-            (self.column_usage_df['dataset_id'] == dataset_id) &
-            (self.column_usage_df['is_used'] == False)
-        ]
+        unused_tables = dataset_tables[dataset_tables['is_used'] == False]
+        unused_columns = dataset_columns[dataset_columns['is_used'] == False]
         
         excluded_tables = unused_tables['table_name'].unique().tolist()
         excluded_columns_count = len(unused_columns)
@@ -305,36 +399,42 @@ class TSQLMigrationPrep:
         print(f"  ⚠️  Excluding {len(excluded_tables)} unused tables")
         print(f"  ⚠️  Excluding {excluded_columns_count} unused columns")
         
+        # Index columns by table once instead of re-filtering inside the loop
+        cols_by_table = dict(list(used_columns_df.groupby('table_name', sort=False, observed=True)))
+        empty_columns_df = used_columns_df.iloc[0:0]
+        
+        rels_from_by_table = self.rels_from_by_table
+        rels_to_by_table = self.rels_to_by_table
+        fk_index = self._fk_index
+        
         # Build table specifications
         table_specs = []
+        columns_count = 0
         
-        for _, table_row in used_tables_df.iterrows():
-            table_name = table_row['table_name']
-            table_columns = used_columns_df[used_columns_df['table_name'] == table_name]
+        for table_row in used_tables_df.itertuples(index=False):
+            table_name = table_row.table_name
+            table_columns = cols_by_table.get(table_name, empty_columns_df)
             
             # Build column specs
             column_specs = []
-            for _, col_row in table_columns.iterrows():
-                column_name = col_row['object_name']
-                pbi_datatype = col_row.get('data_type', 'Unknown')
-                tsql_datatype = self.map_datatype_to_tsql(pbi_datatype)
-                
+            column_names = table_columns['object_name'].to_numpy()
+            if 'data_type' in table_columns.columns:
+                data_types = table_columns['data_type'].to_numpy()
+                tsql_data_types = table_columns['tsql_data_type'].to_numpy()
+            else:
+                data_types = ['Unknown'] * len(column_names)
+                tsql_data_types = [self.map_datatype_to_tsql('Unknown')] * len(column_names)
+            
+            for column_name, pbi_datatype, tsql_datatype in zip(column_names, data_types, tsql_data_types):
                 # Check if column is in a relationship
                 is_fk = False
                 referenced_table = None
                 referenced_column = None
                 
-                if not self.relationships_df.empty:
-                    fk_rels = self.relationships_df[
-                        (self.relationships_df['from_table'] == table_name) &
-                        (self.relationships_df['from_column'] == column_name)
-                    ]
-                    
-                    if not fk_rels.empty:
-                        is_fk = True
-                        rel = fk_rels.iloc[0]
-                        referenced_table = rel.get('to_table', '')
-                        referenced_column = rel.get('to_column', '')
+                fk = fk_index.get((table_name, column_name))
+                if fk:
+                    is_fk = True
+                    referenced_table, referenced_column = fk
                 
                 column_spec = ColumnSpec(
                     column_name=column_name,
@@ -347,23 +447,23 @@ class TSQLMigrationPrep:
                     referenced_column=referenced_column
                 )
                 column_specs.append(column_spec)
+            columns_count += len(column_specs)
             
             # Get relationships for this table
             relationships_from = []
             relationships_to = []
             
-            if not self.relationships_df.empty:
-                rels_from = self.relationships_df[self.relationships_df['from_table'] == table_name]
-                relationships_from = rels_from.to_dict('records')
-                
-                rels_to = self.relationships_df[self.relationships_df['to_table'] == table_name]
-                relationships_to = rels_to.to_dict('records')
+            if table_name in rels_from_by_table:
+                relationships_from = rels_from_by_table[table_name].to_dict('records')
+            
+            if table_name in rels_to_by_table:
+                relationships_to = rels_to_by_table[table_name].to_dict('records')
             
             # Usage metrics
             usage_metrics = {
-                'measures_count': int(table_row.get('table_measure_count', 0)),
-                'relationships_count': int(table_row.get('table_relationship_count', 0)),
-                'dependencies_count': int(table_row.get('dependencies', 0))
+                'measures_count': int(getattr(table_row, 'table_measure_count', 0)),
+                'relationships_count': int(getattr(table_row, 'table_relationship_count', 0)),
+                'dependencies_count': int(getattr(table_row, 'dependencies', 0))
             }
             
             table_spec = TableSpec(
@@ -376,9 +476,7 @@ class TSQLMigrationPrep:
             table_specs.append(table_spec)
         
         # Total relationship count for dataset
-        total_relationships = len(self.relationships_df[
-            self.relationships_df['dataset_id'] == dataset_id
-        ]) if not self.relationships_df.empty else 0
+        total_relationships = len(self.rels_by_ds.get(dataset_id, ()))
         
         print(f"  ✅ Migration spec prepared with {len(table_specs)} tables")
         
@@ -391,11 +489,13 @@ class TSQLMigrationPrep:
             excluded_tables=excluded_tables,
             excluded_columns=excluded_columns_count,
             excluded_measures=0,
-            total_relationships=total_relationships
+            total_relationships=total_relationships,
+            tables_count=len(table_specs),
+            columns_count=columns_count
         )
     
-    def export_migration_spec_to_json(self, migration_spec: DatasetMigrationSpec, output_path: str = ''):
-        """Export migration spec to JSON file"""
+    def export_migration_spec_to_json(self, migration_spec: DatasetMigrationSpec, output_path: str = '') -> bytes:
+        """Export migration spec to JSON file, returning the serialized JSON bytes"""
         spec_dict = {
             'dataset_metadata': {
                 'dataset_id': migration_spec.dataset_id,
@@ -406,19 +506,7 @@ class TSQLMigrationPrep:
             'tables': [
                 {
                     'table_name': table.table_name,
-                    'columns': [
-                        {
-                            'column_name': col.column_name,
-                            'original_data_type': col.data_type,
-                            'tsql_data_type': col.tsql_data_type,
-                            'is_nullable': col.is_nullable,
-                            'is_primary_key': col.is_primary_key,
-                            'is_foreign_key': col.is_foreign_key,
-                            'referenced_table': col.referenced_table,
-                            'referenced_column': col.referenced_column
-                        }
-                        for col in table.columns
-                    ],
+                    'columns': [self._column_spec_to_dict(col) for col in table.columns],
                     'relationships_from': table.relationships_from,
                     'relationships_to': table.relationships_to,
                     'usage_metrics': table.usage_metrics
@@ -437,19 +525,30 @@ class TSQLMigrationPrep:
             }
         }
         
-        # Make JSON safe
-        spec_dict_safe = self._make_json_safe(spec_dict)
+        # Serialized once; the same bytes go to disk and back to the caller.
+        # numpy scalars/arrays are encoded natively, anything else goes through _json_default
+        payload = orjson.dumps(
+            spec_dict,
+            default=self._json_default,
+            option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY
+        )
         
         if output_path:
             # Make sure the directory exists
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            _ensure_dir(os.path.dirname(output_path))
             
-            with open(output_path, "w") as f:
-                json.dump(spec_dict_safe, f, indent=4)
+            Path(output_path).write_bytes(payload)
             
             print(f"  ✅ Exported to {output_path}")
         
-        return spec_dict_safe
+        return payload
+    
+    @staticmethod
+    def _column_spec_to_dict(col: ColumnSpec) -> Dict:
+        """Shallow-copy a ColumnSpec into its JSON shape (data_type is exported as original_data_type)"""
+        col_dict = {f.name: getattr(col, f.name) for f in fields(col)}
+        col_dict['original_data_type'] = col_dict.pop('data_type')
+        return col_dict
     
     def generate_tsql_with_ai(self, migration_spec: DatasetMigrationSpec) -> str:
         """Generate T-SQL CREATE TABLE scripts using AI"""
@@ -458,83 +557,92 @@ class TSQLMigrationPrep:
         
         prompt = self._build_tsql_generation_prompt(migration_spec)
         
-        if self.agent_mode == "claude":
-            response = self.client.messages.create(
-                model="claude-sonnet-4-5",
-                max_tokens=8000,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            return response.content[0].text
+        return self.complete_prompt(prompt, max_tokens=8000, system=_TSQL_SYSTEM_PROMPT)
+    
+    def complete_prompt(self, prompt: str, max_tokens: int, system: Optional[str] = None) -> str:
+        """Send a prompt (plus an optional constant system prompt) to the configured AI client and return the generated text"""
+        # Stream the response so long SQL outputs don't wait on one blocking read;
+        # self.client (and its keep-alive connection pool) is shared by every call
+        with self._ai_slots:
+            if self.agent_mode == "claude":
+                # Plain system prompt: _TSQL_SYSTEM_PROMPT (~300 tokens) is below the 1024-token minimum
+                # cacheable prefix, so a cache_control marker on it would never cache anything
+                extra = {'system': system} if system else {}
+                with self.client.messages.stream(
+                    model="claude-sonnet-4-5",
+                    max_tokens=max_tokens,
+                    messages=[{"role": "user", "content": prompt}],
+                    **extra
+                ) as stream:
+                    return stream.get_final_text()
+            
+            elif self.agent_mode == "gemini":
+                chunks = self.client.models.generate_content_stream(
+                    model="gemini-2.0-flash-exp",
+                    contents=prompt,
+                    config=types.GenerateContentConfig(temperature=0.1, system_instruction=system)
+                )
+                return ''.join(chunk.text or '' for chunk in chunks)
         
-        elif self.agent_mode == "gemini":
-            response = self.client.models.generate_content(
-                model="gemini-2.0-flash-exp",
-                contents=prompt,
-                config=types.GenerateContentConfig(temperature=0.1)
-            )
-            return response.text
+        raise ValueError("Agent mode must be 'claude' or 'gemini'")
+    
+    @staticmethod
+    def _relationship_fields(relationships: List[Dict]):
+        """Yield (from_table, from_column, to_table, to_column, active) per relationship, reading each column once"""
+        if not relationships:
+            return iter(())
+        
+        def column(key, default):
+            return [rel.get(key, default) for rel in relationships]
+        
+        return zip(
+            column('from_table', ''),
+            column('from_column', ''),
+            column('to_table', ''),
+            column('to_column', ''),
+            column('active', True)
+        )
     
     def _build_tsql_generation_prompt(self, migration_spec: DatasetMigrationSpec) -> str:
-        """Build the prompt for AI"""
-        tables_section = []
-        for table in migration_spec.tables:
-            columns_info = []
-            for col in table.columns:
+        """Build the per-dataset part of the prompt, the instructions live in _TSQL_SYSTEM_PROMPT"""
+        # One flat buffer for every table and column line, joined once
+        tables_buf = []
+        append = tables_buf.append
+        for table_idx, table in enumerate(migration_spec.tables):
+            if table_idx:
+                append(NL)
+            append(f"{NL}Table: {table.table_name}{NL}Columns:{NL}")
+            
+            for col_idx, col in enumerate(table.columns):
+                if col_idx:
+                    append(NL)
                 fk_info = f" (FK -> {col.referenced_table}.{col.referenced_column})" if col.is_foreign_key else ""
-                columns_info.append(f"  - {col.column_name}: {col.tsql_data_type}{fk_info}")
+                append(f"  - {col.column_name}: {col.tsql_data_type}{fk_info}")
             
-            tables_section.append(f"""
-Table: {table.table_name}
-Columns:
-{chr(10).join(columns_info)}
-Usage: {table.usage_metrics['measures_count']} measures, {table.usage_metrics['relationships_count']} relationships
-""")
+            append(
+                f"{NL}Usage: {table.usage_metrics['measures_count']} measures, "
+                f"{table.usage_metrics['relationships_count']} relationships{NL}"
+            )
+        tables_section = ''.join(tables_buf)
         
-        relationships_section = []
-        for table in migration_spec.tables:
-            for rel in table.relationships_from:
-                relationships_section.append(
-                    f"  - {rel.get('from_table', '')}.{rel.get('from_column', '')} -> "
-                    f"{rel.get('to_table', '')}.{rel.get('to_column', '')} "
-                    f"[{'Active' if rel.get('active', True) else 'Inactive'}]"
-                )
+        relationships_section = [
+            f"  - {from_table}.{from_column} -> {to_table}.{to_column} [{'Active' if active else 'Inactive'}]"
+            for table in migration_spec.tables
+            for from_table, from_column, to_table, to_column, active in self._relationship_fields(table.relationships_from)
+        ]
         
-        prompt = f"""You are an expert SQL developer specializing in dimensional modeling. Generate T-SQL CREATE TABLE scripts for Power BI dataset migration.
-
-Dataset: {migration_spec.dataset_name}
+        prompt = f"""Dataset: {migration_spec.dataset_name}
 Workspace: {migration_spec.workspace_name}
 
-IMPORTANT CONSTRAINTS:
-1. Use EXACT column names as provided (case-sensitive)
-2. Use the EXACT T-SQL data types specified
-3. Only include tables and columns listed below
-4. Add comments for each table and column documenting the original Power BI context. for example:
-``----------------------------------------------------------------------------------------------------
--- Table: States
--- Description: Represents geographical states, likely within the US, providing demographic and environmental data.
--- Usage in Power BI: 0 measures, 2 relationships
-----------------------------------------------------------------------------------------------------
-CREATE TABLE [States] (
-    [Average Temperature ] FLOAT, -- The average temperature recorded for the state.
-    [Flag] VARCHAR(255),         -- A flag or indicator associated with the state, possibly for categorization or status.
-    [Population] FLOAT,          -- The total population of the state.
-    [State] VARCHAR(255)         -- The name of the state.
-);``
-
-5. Do NOT include PRIMARY KEY constraints
-6. Do NOT include FOREIGN KEY constraints
-7. Do NOT include INDEX definitions
-8. Return the T-SQL script as a valid SQL file ready to be saved in lakehouse as .sql
-
 EXCLUSIONS (already filtered):
 - {len(migration_spec.excluded_tables)} unused tables excluded
 - {migration_spec.excluded_columns} unused columns excluded
 
 TABLES TO CREATE:
-{chr(10).join(tables_section)}
+{tables_section}
 
 RELATIONSHIPS (for reference):
-{chr(10).join(relationships_section) if relationships_section else '  - No relationships defined'}
+{NL.join(relationships_section) if relationships_section else '  - No relationships defined'}
 
 Generate the complete T-SQL migration script now:"""
         
@@ -547,44 +655,62 @@ Generate the complete T-SQL migration script now:"""
 class MCodeExtractor:
     """Extracts M code expressions from lakehouse tables"""
     
+    # Columns read by extract_by_dataset, the rest of the table is never scanned
+    _EXPRESSION_COLUMNS = [
+        'dataset_name', 'workspace_name', 'workspace_id', 'table_name',
+        'expression', 'expression_type', 'object_name', 'column_name'
+    ]
+    
     def __init__(self, spark: Optional[SparkSession] = None):
         self.spark = spark if spark else SparkSession.builder.getOrCreate()
-        self.expressions_df = pd.DataFrame()
+        # Arrow-backed toPandas() moves the (large) M code strings as columnar batches
+        self.spark.conf.set("spark.sql.execution.arrow.pyspark.enabled", "true")
+        self.spark.conf.set("spark.sql.execution.arrow.pyspark.fallback.enabled", "true")
+        self.expressions_spark: Optional[SparkDataFrame] = None
         print("✅ M Code Extractor initialized")
     
-    def load_expressions_from_lakehouse(self, table_name: str = "dataset_expressions") -> pd.DataFrame:
-        """Load M code expressions from lakehouse table"""
+    def load_expressions_from_lakehouse(self, table_name: str = "dataset_expressions") -> Optional[SparkDataFrame]:
+        """Register the M code expressions table (rows are only read per dataset in extract_by_dataset)"""
         print(f"\n📥 Loading M code expressions from: {table_name}")
         
         try:
-            expressions_spark = self.spark.table(table_name)
-            self.expressions_df = expressions_spark.toPandas()
+            self.expressions_spark = self.spark.table(table_name)
             
-            print(f"  ✅ Loaded {len(self.expressions_df)} expression records")
+            stats = self.expressions_spark.agg(
+                F.count(F.lit(1)).alias('total'),
+                F.countDistinct('dataset_id').alias('unique_datasets'),
+                F.countDistinct('table_name').alias('unique_tables')
+            ).first()
             
-            if not self.expressions_df.empty:
-                unique_datasets = self.expressions_df['dataset_id'].nunique()
-                unique_tables = self.expressions_df['table_name'].nunique()
-                print(f"  📊 Unique datasets: {unique_datasets}")
-                print(f"  📊 Unique tables: {unique_tables}")
+            print(f"  ✅ Loaded {stats['total']} expression records")
             
-            return self.expressions_df
+            if stats['total']:
+                print(f"  📊 Unique datasets: {stats['unique_datasets']}")
+                print(f"  📊 Unique tables: {stats['unique_tables']}")
+            
+            return self.expressions_spark
         except Exception as e:
+            self.expressions_spark = None
             print(f"  ❌ Error: {e}")
             print(f"  ℹ️  Table '{table_name}' may not exist")
-            return pd.DataFrame()
+            return None
     
     def extract_by_dataset(self, dataset_id: str) -> Optional[MCodeExtractionResult]:
         """Extract all M code expressions for a specific dataset"""
         print(f"\n🔍 Extracting M code for dataset: {dataset_id}")
         
-        if self.expressions_df.empty:
+        if self.expressions_spark is None:
             print("  ⚠️  No expressions data loaded")
             return None
         
-        dataset_expressions = self.expressions_df[
-            self.expressions_df['dataset_id'] == dataset_id
-        ].copy()
+        # Filter in Spark so the dataset_id predicate is pushed into the Parquet scan
+        wanted_columns = [c for c in self._EXPRESSION_COLUMNS if c in self.expressions_spark.columns]
+        dataset_expressions = (
+            self.expressions_spark
+            .filter(F.col('dataset_id') == dataset_id)
+            .select(*wanted_columns)
+            .toPandas()
+        )
         
         if dataset_expressions.empty:
             print(f"  ⚠️  No expressions found")
@@ -599,20 +725,32 @@ class MCodeExtractor:
         print(f"  📊 Workspace: {workspace_name}")
         print(f"  📊 Found {len(dataset_expressions)} expressions")
         
-        expressions = []
-        for _, row in dataset_expressions.iterrows():
-            expression = MCodeExpression(
+        def column_values(name, default=None):
+            # Whole-column reads instead of building a Series per row
+            if name in dataset_expressions.columns:
+                return dataset_expressions[name].tolist()
+            return [default] * len(dataset_expressions)
+        
+        expressions = [
+            MCodeExpression(
                 dataset_id=dataset_id,
                 dataset_name=dataset_name,
                 workspace_id=workspace_id,
                 workspace_name=workspace_name,
-                table_name=row.get('table_name', ''),
-                expression=row.get('expression', ''),
-                expression_type=row.get('expression_type', 'table'),
-                object_name=row.get('object_name'),
-                column_name=row.get('column_name')
+                table_name=table_name,
+                expression=expression,
+                expression_type=expression_type,
+                object_name=object_name,
+                column_name=column_name
+            )
+            for table_name, expression, expression_type, object_name, column_name in zip(
+                column_values('table_name', ''),
+                column_values('expression', ''),
+                column_values('expression_type', 'table'),
+                column_values('object_name'),
+                column_values('column_name')
             )
-            expressions.append(expression)
+        ]
         
         tables_with_expressions = dataset_expressions['table_name'].unique().tolist()
         
@@ -628,25 +766,18 @@ class MCodeExtractor:
     
     def get_datasets_with_expressions(self) -> pd.DataFrame:
         """Get summary of all datasets that have M code expressions"""
-        if self.expressions_df.empty:
+        if self.expressions_spark is None:
             return pd.DataFrame()
         
-        summary = self.expressions_df.groupby([
+        summary = self.expressions_spark.groupBy(
             'dataset_id',
             'dataset_name',
             'workspace_name'
-        ]).agg({
-            'table_name': 'nunique',
-            'expression': 'count'
-        }).reset_index()
-        
-        summary.columns = [
-            'dataset_id',
-            'dataset_name',
-            'workspace_name',
-            'unique_tables',
-            'total_expressions'
-        ]
+        ).agg(
+            F.countDistinct('table_name').alias('unique_tables'),
+            # Row count per group, no per-value null check
+            F.count(F.lit(1)).alias('total_expressions')
+        ).toPandas()
         
         return summary
 
@@ -654,31 +785,19 @@ class MCodeExtractor:
 # In[9]:
 
 
-class MCodeToSQLIntegration:
-    """Integration module to connect M Code Extractor with AI-based SQL generation"""
-    
-    def __init__(self, m_extractor: MCodeExtractor, tsql_prep: TSQLMigrationPrep):
-        self.m_extractor = m_extractor
-        self.tsql_prep = tsql_prep
-        print("✅ M Code to SQL Integration initialized")
-    
-    def build_m_to_sql_prompt(self,
-                              m_code_expression: MCodeExpression,
-                              target_table_name: str,
-                              additional_context: Optional[str] = None) -> str:
-        """Build AI prompt for M code to SQL transformation"""
-        prompt = f"""You are an expert in Power Query M language and T-SQL. Transform the following M code into an equivalent T-SQL SELECT statement.
+# Constant body of the M code to SQL prompt, only the placeholders change per expression
+_M_TO_SQL_PROMPT = Template("""You are an expert in Power Query M language and T-SQL. Transform the following M code into an equivalent T-SQL SELECT statement.
 
 ## CONTEXT
-{m_code_expression.get_context()}
+${context}
 
 ## SOURCE M CODE
 ```m
-{m_code_expression.expression}
+${expression}
 ```
 
 ## TARGET SQL TABLE
-Data is loaded into: `{target_table_name}`
+Data is loaded into: `${target_table}`
 
 ## TRANSFORMATION REQUIREMENTS
 1. Convert M operations to SQL:
@@ -706,18 +825,71 @@ Data is loaded into: `{target_table_name}`
    - Focus ONLY on transformation logic
    - If M code has data source operations, note as prerequisites
 
-{additional_context if additional_context else ''}
+${extra}
 
 ## OUTPUT
 Generate the T-SQL SELECT statement:
-"""
-        return prompt
+""")
+
+
+class MCodeToSQLIntegration:
+    """Integration module to connect M Code Extractor with AI-based SQL generation"""
+    
+    def __init__(self, m_extractor: MCodeExtractor, tsql_prep: TSQLMigrationPrep):
+        self.m_extractor = m_extractor
+        self.tsql_prep = tsql_prep
+        print("✅ M Code to SQL Integration initialized")
+    
+    def build_m_to_sql_prompt(self,
+                              m_code_expression: MCodeExpression,
+                              target_table_name: str,
+                              additional_context: Optional[str] = None) -> str:
+        """Build AI prompt for M code to SQL transformation"""
+        return _M_TO_SQL_PROMPT.substitute(
+            context=m_code_expression.get_context(),
+            expression=m_code_expression.expression,
+            target_table=target_table_name,
+            extra=additional_context or ''
+        )
+    
+    def _generate_sql_for_expression(self, tbl: str, expr: MCodeExpression, target_table: str) -> Dict:
+        """Run one M code expression through the AI client and return its transformation record"""
+        prompt = self.build_m_to_sql_prompt(expr, target_table)
+        
+        try:
+            generated_sql = self.tsql_prep.complete_prompt(prompt, max_tokens=4000)
+            
+            print(f"    ✅ Generated SQL for {tbl} ({expr.expression_type})")
+            
+            return {
+                'table_name': tbl,
+                'expression_type': expr.expression_type,
+                'object_name': expr.object_name,
+                'original_m_code': expr.expression,
+                'generated_sql': generated_sql,
+                'target_table': target_table,
+                'status': 'success'
+            }
+            
+        except Exception as e:
+            print(f"    ❌ Error ({tbl}): {e}")
+            return {
+                'table_name': tbl,
+                'expression_type': expr.expression_type,
+                'object_name': expr.object_name,
+                'original_m_code': expr.expression,
+                'generated_sql': None,
+                'target_table': target_table,
+                'status': 'failed',
+                'error': str(e)
+            }
     
     def generate_sql_from_m_code(self,
                                  dataset_id: str,
                                  table_name: Optional[str] = None,
-                                 target_table_prefix: str = "stg_") -> Dict:
-        """Generate SQL transformations for M code expressions"""
+                                 target_table_prefix: str = "stg_",
+                                 max_concurrency: int = 8) -> Dict:
+        """Generate SQL transformations for M code expressions (up to max_concurrency AI calls in flight)"""
         print(f"\n🔄 Generating SQL transformations for dataset: {dataset_id}")
         
         if not self.tsql_prep.client:
@@ -738,59 +910,21 @@ Generate the T-SQL SELECT statement:
         
         tables_to_process = [table_name] if table_name else extraction_result.tables_with_expressions
         
+        jobs = []
         for tbl in tables_to_process:
             print(f"\n  🔹 Processing table: {tbl}")
             
-            table_expressions = [
-                exp for exp in extraction_result.expressions
+            target_table = f"{target_table_prefix}{tbl}"
+            jobs.extend(
+                (tbl, exp, target_table) for exp in extraction_result.expressions
                 if exp.table_name == tbl
-            ]
-            
-            for expr in table_expressions:
-                target_table = f"{target_table_prefix}{tbl}"
-                prompt = self.build_m_to_sql_prompt(expr, target_table)
-                
-                try:
-                    if self.tsql_prep.agent_mode == "claude":
-                        response = self.tsql_prep.client.messages.create(
-                            model="claude-sonnet-4-5",
-                            max_tokens=4000,
-                            messages=[{"role": "user", "content": prompt}]
-                        )
-                        generated_sql = response.content[0].text
-                    
-                    elif self.tsql_prep.agent_mode == "gemini":
-                        response = self.tsql_prep.client.models.generate_content(
-                            model="gemini-2.0-flash-exp",
-                            contents=prompt,
-                            config=types.GenerateContentConfig(temperature=0.1)
-                        )
-                        generated_sql = response.text
-                    
-                    results['transformations'].append({
-                        'table_name': tbl,
-                        'expression_type': expr.expression_type,
-                        'object_name': expr.object_name,
-                        'original_m_code': expr.expression,
-                        'generated_sql': generated_sql,
-                        'target_table': target_table,
-                        'status': 'success'
-                    })
-                    
-                    print(f"    ✅ Generated SQL for {expr.expression_type}")
-                    
-                except Exception as e:
-                    print(f"    ❌ Error: {e}")
-                    results['transformations'].append({
-                        'table_name': tbl,
-                        'expression_type': expr.expression_type,
-                        'object_name': expr.object_name,
-                        'original_m_code': expr.expression,
-                        'generated_sql': None,
-                        'target_table': target_table,
-                        'status': 'failed',
-                        'error': str(e)
-                    })
+            )
+        
+        # The calls are network-bound, so overlap them; map() keeps the original order
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+            results['transformations'] = list(
+                pool.map(lambda job: self._generate_sql_for_expression(*job), jobs)
+            )
         
         print(f"\n  ✅ Completed {len(results['transformations'])} transformations")
         
@@ -800,6 +934,63 @@ Generate the T-SQL SELECT statement:
 # In[10]:
 
 
+# Characters dropped from names used in script file names
+class _FilenameCharTable(dict):
+    """str.translate table that keeps word, whitespace and dash characters and deletes the rest, filled lazily per code point"""
+    
+    def __missing__(self, code_point: int):
+        char = chr(code_point)
+        kept = char if char.isalnum() or char.isspace() or char in '_-' else None
+        self[code_point] = kept
+        return kept
+
+
+_FILENAME_CHAR_TABLE = _FilenameCharTable()
+
+_SQL_HEADER_BANNER = "-- " + "=" * 84 + "\n"
+
+# Header of every saved M-to-SQL script, the banners are baked in so only the fields are substituted
+_M_TO_SQL_FILE_HEADER = Template(
+    _SQL_HEADER_BANNER
+    + "-- M-to-SQL Transformation Script\n"
+    + _SQL_HEADER_BANNER
+    + """-- Dataset: ${dataset_name}
+-- Workspace: ${workspace_name}
+-- Dataset ID: ${dataset_id}
+-- Table: ${table_name}
+-- Expression Type: ${expression_type}
+-- Object Name: ${object_name}
+-- Target Table: ${target_table}
+-- Generated: ${timestamp}
+"""
+    + _SQL_HEADER_BANNER
+    + "-- Original M Code Reference:\n"
+    + "-- ${m_code_reference}\n"
+    + _SQL_HEADER_BANNER
+    + "\n"
+)
+
+
+def _safe_filename_part(name: str) -> str:
+    """Strip characters that aren't word, space or dash, then turn spaces into underscores"""
+    return name.translate(_FILENAME_CHAR_TABLE).strip().replace(' ', '_')
+
+
+_WRITE_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_CLOEXEC', 0)
+
+
+def _write_text_file(filepath: str, content: str):
+    """Write content to filepath as UTF-8 text with a raw fd, skipping the buffered text layer"""
+    data = memoryview(content.encode('utf-8'))
+    fd = os.open(filepath, _WRITE_FLAGS, 0o644)
+    try:
+        # os.write may write less than asked for on large payloads
+        while data:
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
+
+
 def save_sql_to_lakehouse_file(dataset_id: str, sql_content: str) -> bool:
     """
     Save SQL CREATE TABLE statements to a .sql file in the lakehouse Files directory.
@@ -823,11 +1014,10 @@ def save_sql_to_lakehouse_file(dataset_id: str, sql_content: str) -> bool:
         sql_filepath = f"{dataset_folder}/{sql_filename}"
         
         # Create directory structure if it doesn't exist
-        os.makedirs(dataset_folder, exist_ok=True)
+        _ensure_dir(dataset_folder)
         
         # Write SQL content to file
-        with open(sql_filepath, 'w', encoding='utf-8') as f:
-            f.write(sql_content)
+        _write_text_file(sql_filepath, sql_content)
         
         print(f"  ✅ SQL file saved to: {sql_filepath}")
         return True
@@ -866,9 +1056,9 @@ def save_m_to_sql_to_lakehouse_files(dataset_id: str, m_to_sql_result: Dict) ->
         dataset_folder = f"{base_path}/{dataset_id}/m_to_sql"
         
         # Create directory structure if it doesn't exist
-        os.makedirs(dataset_folder, exist_ok=True)
+        _ensure_dir(dataset_folder)
         
-        saved_count = 0
+        pending_files = []
         
         for transformation in transformations:
             # Skip failed transformations
@@ -883,12 +1073,12 @@ def save_m_to_sql_to_lakehouse_files(dataset_id: str, m_to_sql_result: Dict) ->
             target_table = transformation.get('target_table', '')
             
             # Create safe filename (sanitize table name and expression type)
-            safe_table_name = re.sub(r'[^\w\s-]', '', table_name).strip().replace(' ', '_')
-            safe_expression_type = re.sub(r'[^\w\s-]', '', expression_type).strip().replace(' ', '_')
+            safe_table_name = _safe_filename_part(table_name)
+            safe_expression_type = _safe_filename_part(expression_type)
             
             # Build filename
             if object_name:
-                safe_object_name = re.sub(r'[^\w\s-]', '', object_name).strip().replace(' ', '_')
+                safe_object_name = _safe_filename_part(object_name)
                 sql_filename = f"{safe_table_name}_{safe_expression_type}_{safe_object_name}.sql"
             else:
                 sql_filename = f"{safe_table_name}_{safe_expression_type}.sql"
@@ -896,32 +1086,31 @@ def save_m_to_sql_to_lakehouse_files(dataset_id: str, m_to_sql_result: Dict) ->
             sql_filepath = f"{dataset_folder}/{sql_filename}"
             
             # Build file content with header comments
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            file_content = f"""-- ====================================================================================
--- M-to-SQL Transformation Script
--- ====================================================================================
--- Dataset: {dataset_name}
--- Workspace: {workspace_name}
--- Dataset ID: {dataset_id}
--- Table: {table_name}
--- Expression Type: {expression_type}
--- Object Name: {object_name if object_name else 'N/A'}
--- Target Table: {target_table}
--- Generated: {timestamp}
--- ====================================================================================
--- Original M Code Reference:
--- {original_m_code[:200]}{'...' if len(original_m_code) > 200 else ''}
--- ====================================================================================
-
-{generated_sql}
-"""
-            
-            # Write SQL content to file
-            with open(sql_filepath, 'w', encoding='utf-8') as f:
-                f.write(file_content)
+            header = _M_TO_SQL_FILE_HEADER.substitute(
+                dataset_name=dataset_name,
+                workspace_name=workspace_name,
+                dataset_id=dataset_id,
+                table_name=table_name,
+                expression_type=expression_type,
+                object_name=object_name or 'N/A',
+                target_table=target_table,
+                timestamp=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                m_code_reference=original_m_code[:200] + '...' if len(original_m_code) > 200 else original_m_code
+            )
+            file_content = ''.join((header, generated_sql, '\n'))
             
-            saved_count += 1
-            print(f"    ✅ Saved: {sql_filename}")
+            pending_files.append((sql_filepath, file_content))
+        
+        # Each write is a round-trip through the lakehouse mount, so issue them together. Two
+        # transformations can map to the same file name; write each path once, with the last
+        # transformation's content, so concurrent writers never share a file (as the serial loop did)
+        unique_files = dict(pending_files)
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            list(pool.map(lambda pending: _write_text_file(*pending), unique_files.items()))
+        
+        for sql_filepath, _ in pending_files:
+            print(f"    ✅ Saved: {os.path.basename(sql_filepath)}")
+        saved_count = len(pending_files)
         
         if saved_count > 0:
             print(f"  ✅ Saved {saved_count} M-to-SQL transformation file(s) to: {dataset_folder}")
@@ -938,6 +1127,146 @@ def save_m_to_sql_to_lakehouse_files(dataset_id: str, m_to_sql_result: Dict) ->
 # In[11]:
 
 
+# Columns TSQLMigrationPrep reads from the table aggregation and the column rows
+TABLE_ANALYSIS_COLUMNS = [
+    'workspace_id', 'workspace_name', 'dataset_id', 'dataset_name', 'table_name',
+    'table_measure_count', 'table_relationship_count', 'dependencies', 'is_used'
+]
+COLUMN_USAGE_COLUMNS = ['dataset_id', 'table_name', 'object_name', 'data_type', 'is_used']
+# Everything either of them needs from ai_object_features
+OBJECT_FEATURE_COLUMNS = [
+    'workspace_id', 'workspace_name', 'dataset_id', 'dataset_name', 'table_name',
+    'object_type', 'object_name', 'data_type', 'is_used', 'usage_score',
+    'table_measure_count', 'table_relationship_count', 'used_by_dependencies'
+]
+
+
+# Output table schemas, passed to createDataFrame so Spark skips type inference on the result rows
+TSQL_MIGRATION_RESULTS_SCHEMA = StructType([
+    StructField('dataset_id', StringType()),
+    StructField('dataset_name', StringType()),
+    StructField('workspace_name', StringType()),
+    StructField('status', StringType()),
+    StructField('tables_count', LongType()),
+    StructField('columns_count', LongType()),
+    StructField('create_table_sql', StringType()),
+    StructField('error_message', StringType()),
+    StructField('timestamp', StringType())
+])
+M_TO_SQL_RESULTS_SCHEMA = StructType([
+    StructField(name, StringType()) for name in [
+        'dataset_id', 'dataset_name', 'workspace_name', 'table_name', 'expression_type',
+        'original_m_code', 'generated_sql', 'target_table', 'status', 'timestamp'
+    ]
+])
+
+MIGRATION_SPECS_PATH = "/lakehouse/default/Files/migration_specs"
+
+
+def _create_table_result_row(result: Dict) -> Dict:
+    """Row of tsql_migration_results for one dataset result"""
+    return {
+        'dataset_id': result['dataset_id'],
+        'dataset_name': result['dataset_name'],
+        'workspace_name': result['workspace_name'],
+        'status': result['status'],
+        'tables_count': result['tables_count'],
+        'columns_count': result['columns_count'],
+        'create_table_sql': result['create_table_sql'] if result['create_table_sql'] else '',
+        'error_message': result['error'] if result['error'] else '',
+        'timestamp': result['timestamp']
+    }
+
+
+def _m_to_sql_result_rows(result: Dict) -> List[Dict]:
+    """Rows of m_to_sql_transformations for one dataset result"""
+    if not result['m_to_sql_transformations']:
+        return []
+    
+    return [
+        {
+            'dataset_id': result['dataset_id'],
+            'dataset_name': result['dataset_name'],
+            'workspace_name': result['workspace_name'],
+            'table_name': t['table_name'],
+            'expression_type': t['expression_type'],
+            'original_m_code': t['original_m_code'],
+            'generated_sql': t['generated_sql'] if t['generated_sql'] else '',
+            'target_table': t['target_table'],
+            'status': t['status'],
+            'timestamp': result['timestamp']
+        }
+        for t in result['m_to_sql_transformations'].get('transformations', [])
+    ]
+
+
+def _delta_version(table_name: str) -> Optional[int]:
+    """Latest Delta commit version of a lakehouse table, used to key the cached reads below"""
+    try:
+        return spark.sql(f"DESCRIBE HISTORY {table_name} LIMIT 1").first()['version']
+    except Exception:
+        return None
+
+
+@lru_cache(maxsize=8)
+def _load_table_pd(table_name: str, version: Optional[int]) -> pd.DataFrame:
+    return spark.table(table_name).toPandas()
+
+
+def load_lakehouse_table_pd(table_name: str, force_refresh: bool = False) -> pd.DataFrame:
+    """Read a lakehouse metadata table into pandas, reusing the last read while its Delta version is unchanged"""
+    if force_refresh:
+        _load_table_pd.cache_clear()
+    version = _delta_version(table_name)
+    if version is None:
+        # No history to tell whether the table changed, always read it
+        return _load_table_pd.__wrapped__(table_name, version)
+    return _load_table_pd(table_name, version)
+
+
+@lru_cache(maxsize=2)
+def _load_object_features_pd(version: Optional[int]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Build the table analysis and column usage frames from ai_object_features (cached per Delta version)"""
+    objects_spark = spark.read.table("ai_object_features")
+    # Cache only the fields used below; the table is scanned twice (table aggregation and column filter)
+    objects_spark = objects_spark.select(
+        *[c for c in OBJECT_FEATURE_COLUMNS if c in objects_spark.columns]
+    ).persist(StorageLevel.MEMORY_AND_DISK)
+    
+    print(f"  ✅ Cached {objects_spark.count()} object feature records")
+    
+    # Prepare table analysis
+    print("\n🔧 Step 2: Preparing table analysis...")
+    tables = objects_spark.groupBy([
+        'workspace_id',
+        'workspace_name',
+        'dataset_id',
+        'dataset_name',
+        'table_name'
+    ]).agg(
+        F.mean('usage_score').alias('usage_score'),
+        F.first('table_measure_count').alias('table_measure_count'),
+        F.first('table_relationship_count').alias('table_relationship_count'),
+        F.sum('used_by_dependencies').alias('dependencies')
+    ).withColumn(
+        'is_used',
+        F.when(F.col('usage_score') > 0, True).otherwise(False)
+    ).select(*TABLE_ANALYSIS_COLUMNS)
+    
+    tables_pd = tables.toPandas()
+    
+    # Filter columns
+    print("\n🔧 Step 3: Filtering column data...")
+    columns = objects_spark.filter(F.col('object_type') == 'column').select(
+        *[c for c in COLUMN_USAGE_COLUMNS if c in objects_spark.columns]
+    )
+    columns_pd = columns.toPandas()
+    
+    objects_spark.unpersist()
+    
+    return tables_pd, columns_pd
+
+
 def run_complete_migration(
     agent_mode: str = 'gemini',
     api_key: str = '',
@@ -946,7 +1275,11 @@ def run_complete_migration(
     generate_create_tables: bool = True,
     generate_m_to_sql: bool = False,
     export_json: bool = True,
-    save_to_lakehouse: bool = True
+    save_to_lakehouse: bool = True,
+    max_workers: int = 4,
+    force_refresh: bool = False,
+    results_batch_size: int = 50,
+    keep_full_results: bool = False
 ):
     """
     Complete migration workflow
@@ -960,6 +1293,11 @@ def run_complete_migration(
         generate_m_to_sql: Generate M-to-SQL transformations (default: False)
         export_json: Export specs to JSON (default: True)
         save_to_lakehouse: Save results to lakehouse (default: True)
+        max_workers: Datasets processed in parallel (default: 4)
+        force_refresh: Re-read the lakehouse metadata tables even if unchanged (default: False)
+        results_batch_size: Dataset results buffered before each lakehouse write (default: 50)
+        keep_full_results: Keep specs, SQL and transformations in all_results after they are saved (default: False,
+                           they are dropped once saved, leaving the json_spec file path in their place)
     
     Returns:
         Dictionary with all results and summary
@@ -972,40 +1310,26 @@ def run_complete_migration(
     print(f"   M to SQL: {'Yes' if generate_m_to_sql and api_key else 'No'}")
     print(f"{'='*80}\n")
     
+    # Folders may have been deleted since the last run, so check each one again once
+    _created_dirs.clear()
+    
+    # Arrow-backed toPandas() for every lakehouse read below (falls back to the row path if a type isn't supported)
+    spark.conf.set("spark.sql.execution.arrow.pyspark.enabled", "true")
+    spark.conf.set("spark.sql.execution.arrow.pyspark.fallback.enabled", "true")
+    spark.conf.set("spark.sql.execution.arrow.maxRecordsPerBatch", "100000")
+    
     # Load lakehouse tables
     print("📊 Step 1: Loading lakehouse tables...")
-    data_context_pd = spark.table("ai_dataset_context").toPandas()
-    relationships_pd = spark.table("dataset_relationships").toPandas()
-    objects_spark = spark.read.table("ai_object_features")
+    data_context_pd = load_lakehouse_table_pd("ai_dataset_context", force_refresh)
+    relationships_pd = load_lakehouse_table_pd("dataset_relationships", force_refresh)
     
     print(f"  ✅ Loaded {len(data_context_pd)} datasets from context")
     
-    # Prepare table analysis
-    print("\n🔧 Step 2: Preparing table analysis...")
-    tables = objects_spark.groupBy([
-        'workspace_id',
-        'workspace_name',
-        'dataset_id',
-        'dataset_name',
-        'table_name'
-    ]).agg(
-        F.mean('usage_score').alias('usage_score'),
-        F.first('table_measure_count').alias('table_measure_count'),
-        F.first('table_column_count').alias('table_column_count'),
-        F.first('table_relationship_count').alias('table_relationship_count'),
-        F.first('table_is_isolated').alias('table_is_isolated'),
-        F.sum('used_by_dependencies').alias('dependencies')
-    ).withColumn(
-        'is_used',
-        F.when(F.col('usage_score') > 0, True).otherwise(False)
-    )
-    
-    tables_pd = tables.toPandas()
-    
-    # Filter columns
-    print("\n🔧 Step 3: Filtering column data...")
-    columns = objects_spark[objects_spark['object_type'] == 'column']
-    columns_pd = columns.toPandas()
+    if force_refresh:
+        _load_object_features_pd.cache_clear()
+    objects_version = _delta_version("ai_object_features")
+    load_object_features = _load_object_features_pd if objects_version is not None else _load_object_features_pd.__wrapped__
+    tables_pd, columns_pd = load_object_features(objects_version)
     
     print(f"  ✅ Prepared {len(tables_pd)} table records")
     print(f"  ✅ Prepared {len(columns_pd)} column records")
@@ -1045,11 +1369,8 @@ def run_complete_migration(
     print(f"🔄 Processing {len(datasets_to_process)} datasets...")
     print(f"{'='*80}\n")
     
-    all_results = []
-    successful_count = 0
-    failed_count = 0
-    
-    for idx, dataset_id in enumerate(datasets_to_process, 1):
+    def process_dataset(idx: int, dataset_id: str) -> Dict:
+        """Run every enabled step for one dataset and return its result record"""
         try:
             print(f"\n{'─'*80}")
             print(f"📦 [{idx}/{len(datasets_to_process)}] Processing: {dataset_id}")
@@ -1069,15 +1390,15 @@ def run_complete_migration(
                 'status': 'success',
                 'error': None,
                 'timestamp': datetime.now().isoformat(),
-                'tables_count': len(dataset_meta.tables),
-                'columns_count': sum(len(t.columns) for t in dataset_meta.tables)
+                'tables_count': dataset_meta.tables_count,
+                'columns_count': dataset_meta.columns_count
             }
             
             # Export to JSON
             if export_json:
                 json_spec = tsql_prep.export_migration_spec_to_json(
                     dataset_meta,
-                    output_path=f"/lakehouse/default/Files/migration_specs/{dataset_id}.json"
+                    output_path=f"{MIGRATION_SPECS_PATH}/{dataset_id}.json"
                 )
                 result['json_spec'] = json_spec
             
@@ -1106,17 +1427,11 @@ def run_complete_migration(
                 if m_to_sql_result:
                     save_m_to_sql_to_lakehouse_files(dataset_id, m_to_sql_result)
             
-            all_results.append(result)
-            successful_count += 1
-            
             print(f"\n✅ Dataset {dataset_meta.dataset_name} processed successfully")
             
-            # Small delay for API rate limits
-            if idx < len(datasets_to_process):
-                time.sleep(1)
+            return result
         
         except Exception as e:
-            failed_count += 1
             error_result = {
                 'dataset_id': dataset_id,
                 'dataset_name': 'Unknown',
@@ -1131,8 +1446,86 @@ def run_complete_migration(
                 'tables_count': 0,
                 'columns_count': 0
             }
-            all_results.append(error_result)
-            print(f"\n❌ Error processing dataset: {e}")
+            print(f"\n❌ Error processing dataset {dataset_id}: {e}")
+            return error_result
+    
+    # Result rows are written to the lakehouse in batches while datasets are still running,
+    # the first write of the run overwrites the table and the rest append to it
+    pending_rows = {'tsql_migration_results': [], 'm_to_sql_transformations': []}
+    result_tables = {
+        'tsql_migration_results': TSQL_MIGRATION_RESULTS_SCHEMA,
+        'm_to_sql_transformations': M_TO_SQL_RESULTS_SCHEMA
+    }
+    write_counts = {}
+    flush_failed = False
+    
+    def flush_results():
+        """Write the buffered result rows to their lakehouse tables"""
+        nonlocal flush_failed
+        for table_name, rows in pending_rows.items():
+            if not rows:
+                continue
+            
+            # Taken off the buffer before writing, so a failed write is never retried with the same rows
+            batch = rows.copy()
+            rows.clear()
+            
+            write_mode = "append" if table_name in write_counts else "overwrite"
+            try:
+                # The result dicts go straight to Spark; the explicit schema already types every column
+                spark.createDataFrame(batch, schema=result_tables[table_name]).write.mode(write_mode).saveAsTable(table_name)
+            except Exception:
+                flush_failed = True
+                raise
+            write_counts[table_name] = write_counts.get(table_name, 0) + 1
+    
+    # Datasets are independent and I/O-bound; AI calls are throttled inside TSQLMigrationPrep.complete_prompt
+    # Totals are accumulated as results come back so the summary doesn't re-walk them
+    all_results = []
+    successful_count = 0
+    total_tables = 0
+    total_columns = 0
+    buffered_count = 0
+    
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            for result in pool.map(
+                process_dataset,
+                range(1, len(datasets_to_process) + 1),
+                datasets_to_process
+            ):
+                successful_count += result['status'] == 'success'
+                total_tables += result['tables_count']
+                total_columns += result['columns_count']
+                
+                if save_to_lakehouse:
+                    if generate_create_tables:
+                        pending_rows['tsql_migration_results'].append(_create_table_result_row(result))
+                    if generate_m_to_sql:
+                        pending_rows['m_to_sql_transformations'].extend(_m_to_sql_result_rows(result))
+                    
+                    buffered_count += 1
+                    if buffered_count >= results_batch_size:
+                        flush_results()
+                        buffered_count = 0
+                
+                if not keep_full_results:
+                    # Large fields already live in the lakehouse (result tables, .sql and .json files)
+                    if save_to_lakehouse:
+                        result['create_table_sql'] = None
+                        result['m_to_sql_transformations'] = None
+                    if export_json and result['json_spec'] is not None:
+                        result['migration_spec'] = None
+                        result['json_spec'] = f"{MIGRATION_SPECS_PATH}/{result['dataset_id']}.json"
+                
+                all_results.append(result)
+    finally:
+        # Rows of datasets that already finished are written even if the run is interrupted,
+        # unless it was a lakehouse write that failed (a second failure would hide the first error)
+        if save_to_lakehouse and not flush_failed:
+            flush_results()
+    
+    failed_count = len(all_results) - successful_count
     
     # Save results to lakehouse
     if save_to_lakehouse and all_results:
@@ -1140,49 +1533,18 @@ def run_complete_migration(
         print(f"💾 Saving results to lakehouse")
         print(f"{'='*80}\n")
         
-        # CREATE TABLE results
-        if generate_create_tables:
-            create_table_data = []
-            for result in all_results:
-                create_table_data.append({
-                    'dataset_id': result['dataset_id'],
-                    'dataset_name': result['dataset_name'],
-                    'workspace_name': result['workspace_name'],
-                    'status': result['status'],
-                    'tables_count': result['tables_count'],
-                    'columns_count': result['columns_count'],
-                    'create_table_sql': result['create_table_sql'] if result['create_table_sql'] else '',
-                    'error_message': result['error'] if result['error'] else '',
-                    'timestamp': result['timestamp']
-                })
-            
-            create_df = pd.DataFrame(create_table_data)
-            spark.createDataFrame(create_df).write.mode("overwrite").saveAsTable("tsql_migration_results")
-            print(f"  ✅ CREATE TABLE results saved to tsql_migration_results")
+        # Compact the small files left by the incremental appends
+        for table_name, count in write_counts.items():
+            if count > 1:
+                try:
+                    spark.sql(f"OPTIMIZE {table_name}")
+                except Exception as e:
+                    print(f"  ⚠️  Could not optimize {table_name}: {e}")
         
-        # M-to-SQL results
-        if generate_m_to_sql:
-            m_to_sql_data = []
-            for result in all_results:
-                if result['m_to_sql_transformations']:
-                    for t in result['m_to_sql_transformations'].get('transformations', []):
-                        m_to_sql_data.append({
-                            'dataset_id': result['dataset_id'],
-                            'dataset_name': result['dataset_name'],
-                            'workspace_name': result['workspace_name'],
-                            'table_name': t['table_name'],
-                            'expression_type': t['expression_type'],
-                            'original_m_code': t['original_m_code'],
-                            'generated_sql': t['generated_sql'] if t['generated_sql'] else '',
-                            'target_table': t['target_table'],
-                            'status': t['status'],
-                            'timestamp': result['timestamp']
-                        })
-            
-            if m_to_sql_data:
-                m_df = pd.DataFrame(m_to_sql_data)
-                spark.createDataFrame(m_df).write.mode("overwrite").saveAsTable("m_to_sql_transformations")
-                print(f"  ✅ M-to-SQL results saved to m_to_sql_transformations")
+        if 'tsql_migration_results' in write_counts:
+            print(f"  ✅ CREATE TABLE results saved to tsql_migration_results")
+        if 'm_to_sql_transformations' in write_counts:
+            print(f"  ✅ M-to-SQL results saved to m_to_sql_transformations")
     
     # Summary
     print(f"\n{'='*80}")
@@ -1191,8 +1553,8 @@ def run_complete_migration(
     print(f"  ✅ Total Datasets: {len(datasets_to_process)}")
     print(f"  ✅ Successful: {successful_count}")
     print(f"  ❌ Failed: {failed_count}")
-    print(f"  📊 Total Tables: {sum(r['tables_count'] for r in all_results)}")
-    print(f"  📊 Total Columns: {sum(r['columns_count'] for r in all_results)}")
+    print(f"  📊 Total Tables: {total_tables}")
+    print(f"  📊 Total Columns: {total_columns}")
     print(f"{'='*80}\n")
     
     return {
@@ -1201,8 +1563,8 @@ def run_complete_migration(
             'total_datasets': len(datasets_to_process),
             'successful': successful_count,
             'failed': failed_count,
-            'total_tables': sum(r['tables_count'] for r in all_results),
-            'total_columns': sum(r['columns_count'] for r in all_results)
+            'total_tables': total_tables,
+            'total_columns': total_columns
         }
     }
 
@@ -1296,7 +1658,18 @@ if results['all_results']:
     print(f"Tables: {first_result['tables_count']}")
     print(f"Columns: {first_result['columns_count']}")
     
-    if first_result['create_table_sql']:
+    # The SQL is dropped from all_results once saved (keep_full_results=False), read it back from the lakehouse
+    create_table_sql = first_result['create_table_sql']
+    if create_table_sql is None and first_result['status'] == 'success' and spark.catalog.tableExists("tsql_migration_results"):
+        saved = (
+            spark.table("tsql_migration_results")
+            .where(col("dataset_id") == first_result['dataset_id'])
+            .select("create_table_sql")
+            .take(1)
+        )
+        create_table_sql = saved[0]['create_table_sql'] if saved else None
+    
+    if create_table_sql:
         print("\n📜 CREATE TABLE SQL (first 500 chars):")
-        print(first_result['create_table_sql'][:500] + "...")
+        print(create_table_sql[:500] + "...")
 
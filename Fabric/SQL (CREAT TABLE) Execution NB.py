@@ -21,6 +21,8 @@
 # Imports
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from typing import List, Optional, Dict
 import sempy_labs
 from sempy_labs import ConnectWarehouse
@@ -50,6 +52,11 @@ sempy_labs.list_warehouses()
 # In[10]:
 
 
+# Opening ```sql fence (with the whitespace after it, plus a closing fence it runs into)
+# or a bare closing ``` line
+_MARKDOWN_FENCE_RE = re.compile(r'^```(?:sql\s*(?:```\s*$)?|\s*$)', re.MULTILINE)
+
+
 def read_sql_file(dataset_id: str) -> str:
     """
     Read SQL file from lakehouse and clean markdown code block markers.
@@ -68,15 +75,18 @@ def read_sql_file(dataset_id: str) -> str:
     if not os.path.exists(sql_filepath):
         raise FileNotFoundError(f"SQL file not found: {sql_filepath}")
     
-    with open(sql_filepath, 'r', encoding='utf-8') as f:
-        content = f.read()
+    content = Path(sql_filepath).read_text(encoding='utf-8')
     
-    # Remove markdown code block markers
-    content = re.sub(r'^```sql\s*', '', content, flags=re.MULTILINE)
-    content = re.sub(r'^```\s*$', '', content, flags=re.MULTILINE)
+    # Remove markdown code block markers (opening ```sql and closing ```) in one pass
+    content = _MARKDOWN_FENCE_RE.sub('', content)
     
     return content.strip()
 
+# A statement starts on a line beginning with CREATE TABLE and ends on the first later line ending in ';'
+_CREATE_TABLE_LINE_RE = re.compile(r'^[^\S\n]*CREATE[^\S\n]+TABLE', re.IGNORECASE | re.MULTILINE)
+_STATEMENT_END_LINE_RE = re.compile(r';[^\S\n]*$', re.MULTILINE)
+
+
 def split_sql_statements(sql_content: str) -> List[str]:
     """
     Split SQL content into individual CREATE TABLE statements.
@@ -90,55 +100,83 @@ def split_sql_statements(sql_content: str) -> List[str]:
     """
     statements = []
     
-    # Split by lines and process line by line to handle multi-line statements
-    lines = sql_content.split('\n')
-    current_statement = []
-    in_create_table = False
+    # Locate every statement start in one compiled scan, then cut the text between them
+    starts = [m.start() for m in _CREATE_TABLE_LINE_RE.finditer(sql_content)]
     
-    for line in lines:
-        stripped = line.strip()
+    for start, next_start in zip(starts, starts[1:] + [len(sql_content)]):
+        end = next_start
         
-        # Skip empty lines and pure comment lines when not in a statement
-        if not in_create_table and (not stripped or stripped.startswith('--')):
-            continue
+        # The terminating ';' line is searched for after the CREATE TABLE line itself
+        first_line_end = sql_content.find('\n', start, next_start)
+        if first_line_end != -1:
+            end_match = _STATEMENT_END_LINE_RE.search(sql_content, first_line_end + 1, next_start)
+            if end_match:
+                end = end_match.end()
         
-        # Check if this line starts a CREATE TABLE
-        if re.match(r'CREATE\s+TABLE', stripped, re.IGNORECASE):
-            # If we were building a statement, save it first
-            if current_statement:
-                stmt = '\n'.join(current_statement).strip()
-                if stmt:
-                    statements.append(stmt)
-            current_statement = [line]
-            in_create_table = True
-        elif in_create_table:
-            current_statement.append(line)
-            # Check if this line ends the statement (semicolon at end)
-            if stripped.endswith(';'):
-                stmt = '\n'.join(current_statement).strip()
-                if stmt:
-                    statements.append(stmt)
-                current_statement = []
-                in_create_table = False
-    
-    # Handle any remaining statement
-    if current_statement:
-        stmt = '\n'.join(current_statement).strip()
+        stmt = sql_content[start:end].strip()
         if stmt:
             statements.append(stmt)
     
     return statements
 
 
-def execute_sql_in_warehouse(warehouse_id: str, sql_statements: List[str], dataset_id: str) -> Dict:
+# Warehouses that already had result-set caching checked/enabled in this session
+_result_set_caching_checked = set()
+
+
+def ensure_result_set_caching(conn, warehouse_id: str):
     """
-    Execute SQL statements in a Fabric warehouse one at a time.
-    Stops on first error for debugging.
+    Turn on Fabric Warehouse result-set caching once per warehouse per session,
+    so repeated introspection SELECTs on reruns are served from the cache.
+    Failures are reported but never block statement execution.
+    
+    Args:
+        conn: Open ConnectWarehouse connection
+        warehouse_id: The warehouse ID the connection belongs to
+    """
+    if warehouse_id in _result_set_caching_checked:
+        return
+    _result_set_caching_checked.add(warehouse_id)
+    
+    try:
+        status = conn.query(
+            "SELECT name, is_result_set_caching_on FROM sys.databases WHERE name = DB_NAME()"
+        )
+        if status.empty:
+            return
+        
+        if not bool(status.iloc[0]['is_result_set_caching_on']):
+            database_name = status.iloc[0]['name']
+            conn.query(f"ALTER DATABASE [{database_name}] SET RESULT_SET_CACHING ON")
+            print(f"  ✅ Result-set caching enabled for {database_name}")
+    except Exception as e:
+        print(f"  ⚠️  Could not enable result-set caching: {str(e)}")
+
+
+def _table_name_for_log(statement: str, idx: int) -> str:
+    """Extract the table name from a CREATE TABLE statement for logging (falls back to the statement number)"""
+    table_match = re.search(r'CREATE\s+TABLE\s+(?:\[)?([^\s\]]+)(?:\])?', statement, re.IGNORECASE)
+    return table_match.group(1) if table_match else f"Statement {idx}"
+
+
+def _as_transaction_batch(statements: List[str]) -> str:
+    """Join statements into one all-or-nothing T-SQL batch"""
+    body = '\n'.join(stmt if stmt.rstrip().endswith(';') else stmt + ';' for stmt in statements)
+    return f"SET XACT_ABORT ON;\nBEGIN TRANSACTION;\n{body}\nCOMMIT TRANSACTION;"
+
+
+def execute_sql_in_warehouse(warehouse_id: str, sql_statements: List[str], dataset_id: str, batch_size: int = 25) -> Dict:
+    """
+    Execute SQL statements in a Fabric warehouse in transactional batches.
+    Each batch of up to batch_size statements is sent in a single round-trip; if a
+    batch fails it is rolled back and re-run one statement at a time to find the
+    failing statement. Stops on first error for debugging.
     
     Args:
         warehouse_id: The warehouse ID to connect to
         sql_statements: List of SQL statements to execute
         dataset_id: Dataset ID for logging purposes
+        batch_size: Maximum number of statements sent per round-trip
     
     Returns:
         Dictionary with execution results
@@ -159,40 +197,59 @@ def execute_sql_in_warehouse(warehouse_id: str, sql_statements: List[str], datas
     print(f"📊 Total statements: {len(sql_statements)}")
     print(f"{'='*80}\n")
     
+    table_names = [_table_name_for_log(stmt, idx) for idx, stmt in enumerate(sql_statements, 1)]
+    batch_size = max(1, batch_size)
+    
     try:
         with ConnectWarehouse(warehouse_id) as conn:
-            for idx, statement in enumerate(sql_statements, 1):
-                # Extract table name for logging (if possible)
-                table_match = re.search(r'CREATE\s+TABLE\s+(?:\[)?([^\s\]]+)(?:\])?', statement, re.IGNORECASE)
-                table_name = table_match.group(1) if table_match else f"Statement {idx}"
+            ensure_result_set_caching(conn, warehouse_id)
+            
+            for batch_start in range(0, len(sql_statements), batch_size):
+                batch = sql_statements[batch_start:batch_start + batch_size]
+                batch_end = batch_start + len(batch)
                 
-                print(f"  [{idx}/{len(sql_statements)}] Executing: {table_name}")
+                print(f"  [{batch_start + 1}-{batch_end}/{len(sql_statements)}] Executing batch of {len(batch)} statement(s)")
                 
                 try:
-                    # Execute the statement
-                    conn.query(statement)
-                    results['executed'] += 1
-                    print(f"    ✅ Success: {table_name}")
-                    
+                    conn.query(_as_transaction_batch(batch))
+                    results['executed'] += len(batch)
+                    for table_name in table_names[batch_start:batch_end]:
+                        print(f"    ✅ Success: {table_name}")
+                    continue
                 except Exception as e:
-                    results['failed'] += 1
-                    error_info = {
-                        'statement_number': idx,
-                        'table_name': table_name,
-                        'error': str(e),
-                        'sql_snippet': statement[:200] + "..." if len(statement) > 200 else statement
-                    }
-                    results['errors'].append(error_info)
+                    print(f"    ⚠️  Batch failed and was rolled back, retrying statements one at a time: {str(e)}")
+                
+                for idx in range(batch_start + 1, batch_end + 1):
+                    statement = sql_statements[idx - 1]
+                    table_name = table_names[idx - 1]
                     
-                    print(f"\n    ❌ ERROR on statement {idx} ({table_name})")
-                    print(f"    Error: {str(e)}")
-                    print(f"    SQL snippet: {statement[:200]}...")
-                    print(f"\n{'='*80}")
-                    print(f"🛑 STOPPING: First error encountered (debugging mode)")
-                    print(f"{'='*80}\n")
+                    print(f"  [{idx}/{len(sql_statements)}] Executing: {table_name}")
                     
-                    # Stop on first error
-                    raise Exception(f"Failed to execute statement {idx} ({table_name}): {str(e)}") from e
+                    try:
+                        # Execute the statement
+                        conn.query(statement)
+                        results['executed'] += 1
+                        print(f"    ✅ Success: {table_name}")
+                        
+                    except Exception as e:
+                        results['failed'] += 1
+                        error_info = {
+                            'statement_number': idx,
+                            'table_name': table_name,
+                            'error': str(e),
+                            'sql_snippet': statement[:200] + "..." if len(statement) > 200 else statement
+                        }
+                        results['errors'].append(error_info)
+                        
+                        print(f"\n    ❌ ERROR on statement {idx} ({table_name})")
+                        print(f"    Error: {str(e)}")
+                        print(f"    SQL snippet: {statement[:200]}...")
+                        print(f"\n{'='*80}")
+                        print(f"🛑 STOPPING: First error encountered (debugging mode)")
+                        print(f"{'='*80}\n")
+                        
+                        # Stop on first error
+                        raise Exception(f"Failed to execute statement {idx} ({table_name}): {str(e)}") from e
     
     except Exception as e:
         # Re-raise to stop execution
@@ -206,6 +263,30 @@ def execute_sql_in_warehouse(warehouse_id: str, sql_statements: List[str], datas
 # In[11]:
 
 
+def discover_dataset_ids(base_path: str) -> List[str]:
+    """
+    Find dataset folders under base_path that contain a <dataset_id>_create_tables.sql file.
+    Uses scandir's cached entry types and checks the candidate files concurrently,
+    since each stat is a metadata round-trip on the lakehouse mount.
+    
+    Args:
+        base_path: Folder holding one sub-folder per dataset
+    
+    Returns:
+        List of dataset IDs with a CREATE TABLE script
+    """
+    with os.scandir(base_path) as entries:
+        dataset_dirs = [entry for entry in entries if entry.is_dir()]
+    
+    def has_sql_file(entry) -> bool:
+        return os.path.isfile(os.path.join(entry.path, f"{entry.name}_create_tables.sql"))
+    
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        found = list(pool.map(has_sql_file, dataset_dirs))
+    
+    return [entry.name for entry, has_file in zip(dataset_dirs, found) if has_file]
+
+
 def execute_sql_files(dataset_ids: Optional[List[str]] = None) -> Dict:
     """
     Execute SQL files from the lakehouse in a Fabric warehouse.
@@ -231,12 +312,7 @@ def execute_sql_files(dataset_ids: Optional[List[str]] = None) -> Dict:
         dataset_ids = []
         
         if os.path.exists(SQL_SCRIPTS_BASE_PATH):
-            for item in os.listdir(SQL_SCRIPTS_BASE_PATH):
-                dataset_dir = os.path.join(SQL_SCRIPTS_BASE_PATH, item)
-                if os.path.isdir(dataset_dir):
-                    sql_file = os.path.join(dataset_dir, f"{item}_create_tables.sql")
-                    if os.path.exists(sql_file):
-                        dataset_ids.append(item)
+            dataset_ids = discover_dataset_ids(SQL_SCRIPTS_BASE_PATH)
         
         print(f"  ✅ Found {len(dataset_ids)} SQL files")
         if not dataset_ids:
@@ -25,7 +25,7 @@ if errorlevel 1 (
 echo Python found!
 echo.
 echo Installing required packages...
-python -m pip install --quiet pandas requests
+python -m pip install --quiet pandas requests pyarrow
 
 echo.
 echo Starting extraction...
@@ -35,7 +35,7 @@ echo This may take 30-60 seconds. Please wait...
 echo.
 
 REM Run the extractor
-python extract_fuel_data.py -o "data"
+python extract_fuel_data.py -o "data" --format csv
 
 if errorlevel 1 (
     echo.
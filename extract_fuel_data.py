@@ -1,43 +1,95 @@
 """
 Complete Fuel Data Extraction
 Extracts READINGS, LOADS, TANK SIZES, INV SETTINGS, and SALES (actual) from Google Sheets
-Outputs 5 CSV files in long format (tidy data)
+Outputs 6 files in long format (tidy data): Parquet by default, CSV with --format csv
 
 Usage:
     python extract_fuel_data.py
     python extract_fuel_data.py --output /path/to/output/folder
+    python extract_fuel_data.py --format csv
+    python extract_fuel_data.py --no-cache
+    python extract_fuel_data.py --workers 4   # opt-in process pool for very large sheets
 """
 
 import pandas as pd
+import numpy as np
 import requests
-from io import StringIO
+from requests.adapters import HTTPAdapter
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import argparse
+import atexit
+import csv
+import multiprocessing
 import os
+import random
+import re
 import time
+from collections import namedtuple
+from functools import lru_cache
+from sheet_cache import CACHE_DIR, fetch_sheet
 from site_identifier import identify_sites
+
+# Configuration
+LA_SHEET = ""
+RENO_SHEET = ""
+
 # Default output location (current directory)
 DEFAULT_OUTPUT_DIR = "."
 
+# One pooled HTTP session for every sheet request, so the RENO fetch and retries reuse the
+# LA connection instead of redoing the TCP/TLS handshake (retries are handled in _download_sheet)
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=0))
+atexit.register(SESSION.close)
+
+# Product rows are those naming one of the fuel products (87, 88, 91, dsl, racing, red)
+_PRODUCT_RE = re.compile(r'87|88|91|dsl|racing|red')
+_TOTAL_RE = re.compile(r'total', re.IGNORECASE)
+
+
+def _backoff_delay(attempt, max_delay, retry_after=None):
+    """
+    Seconds to wait before retrying after a failed attempt (0-based)
+    
+    Honors a server's Retry-After seconds; otherwise exponential backoff from 1s, capped at
+    max_delay, with jitter so concurrent fetches don't retry in lockstep
+    """
+    if retry_after is not None:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass  # HTTP-date form, fall back to backoff
+    
+    return min(max_delay, 2 ** attempt) * (0.5 + random.random())
+
 
-def fetch_data(sheet_url, city_name, max_retries=3, retry_delay=60):
-    """Fetch Google Sheets data with retry logic for rate limiting"""
+def fetch_data(sheet_url, city_name, max_retries=3, retry_delay=60, use_cache=True):
+    """Fetch Google Sheets data with retry logic for rate limiting (retry_delay caps the backoff, in seconds)"""
     print(f"Fetching data from Google Sheets ({city_name})...")
     
+    # The shared snapshot (see sheet_cache) is reused only while the server reports the same version
+    df = fetch_sheet(sheet_url, max_age=0, use_cache=use_cache, session=SESSION,
+                     get=lambda url: _download_sheet(url, city_name, max_retries, retry_delay))
+    print(f"✓ Data shape: {df.shape}")
+    return df
+
+
+def _download_sheet(sheet_url, city_name, max_retries, retry_delay):
+    """GET a sheet, retrying on rate limits, timeouts and network errors; returns the 200 response"""
     for attempt in range(max_retries):
         try:
-            response = requests.get(sheet_url, timeout=30)
+            response = SESSION.get(sheet_url, timeout=30)
             
             # Check if request was successful
             if response.status_code == 200:
-                df = pd.read_csv(StringIO(response.text), header=None, low_memory=False)
-                print(f"✓ Data shape: {df.shape}")
-                return df
+                return response
             elif response.status_code == 429:  # Too Many Requests
                 print(f"⚠️  Rate limit hit for {city_name} data (attempt {attempt + 1}/{max_retries})")
                 if attempt < max_retries - 1:
-                    print(f"   Waiting {retry_delay} seconds before retrying...")
-                    time.sleep(retry_delay)
+                    delay = _backoff_delay(attempt, retry_delay, response.headers.get('Retry-After'))
+                    print(f"   Waiting {delay:.1f} seconds before retrying...")
+                    time.sleep(delay)
                 else:
                     raise Exception(f"Failed to fetch {city_name} data after {max_retries} attempts due to rate limiting")
             else:
@@ -46,635 +98,581 @@ def fetch_data(sheet_url, city_name, max_retries=3, retry_delay=60):
         except requests.exceptions.Timeout:
             print(f"⚠️  Timeout while fetching {city_name} data (attempt {attempt + 1}/{max_retries})")
             if attempt < max_retries - 1:
-                print(f"   Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
+                delay = _backoff_delay(attempt, retry_delay)
+                print(f"   Retrying in {delay:.1f} seconds...")
+                time.sleep(delay)
             else:
                 raise Exception(f"Failed to fetch {city_name} data after {max_retries} timeout attempts")
                 
         except requests.exceptions.RequestException as e:
             print(f"⚠️  Network error while fetching {city_name} data: {e}")
             if attempt < max_retries - 1:
-                print(f"   Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
+                delay = _backoff_delay(attempt, retry_delay)
+                print(f"   Retrying in {delay:.1f} seconds...")
+                time.sleep(delay)
             else:
                 raise Exception(f"Failed to fetch {city_name} data after {max_retries} attempts: {e}")
     
     raise Exception(f"Failed to fetch {city_name} data after all retry attempts")
 
 
-def get_all_dates(df, start_col=6):
-    """Extract all date columns from the sheet (up to today only)"""
-    print("\nExtracting all dates...")
-    dates_row = df.iloc[0, start_col:]
-    
-    today = pd.Timestamp.now().normalize()  # Get today's date at midnight
-    
-    date_data = []
-    for col_idx, date_val in enumerate(dates_row, start=start_col):
-        if pd.notna(date_val):
-            try:
-                parsed = pd.to_datetime(str(date_val), format='%b-%d-%y', errors='coerce')
-                if parsed and parsed <= today:  # Only include dates up to today
-                    date_data.append((col_idx, parsed))
-            except:
-                pass
-    
-    print(f"✓ Found {len(date_data)} dates (up to today)")
-    if date_data:
-        print(f"  Date range: {date_data[0][1].date()} to {date_data[-1][1].date()}")
-    return date_data
+@lru_cache(maxsize=None)
+def _classify(product):
+    """
+    Classify a product cell's text (memoized - the same few product labels repeat in every section of every site)
+    
+    Returns:
+        tuple: (base_product, is_total) - base_product is the product text (the first-seen copy,
+        shared by all later calls), or None for non-product rows
+    """
+    if _PRODUCT_RE.search(product) is None:
+        return None, False
+    return product, _TOTAL_RE.search(product) is not None
 
 
-def extract_site_readings(df, site_row, site_name, date_columns, city):
-    """Extract readings for a single site"""
-    print(f"  Extracting READINGS for {site_name}...")
-    
-    # Find READINGS section
-    reading_start_row = None
-    reading_end_row = None
-    
-    for offset in range(20):
-        row_idx = site_row + offset
-        if row_idx >= len(df):
-            break
-        
-        section_label = str(df.iloc[row_idx, 3]).strip() if pd.notna(df.iloc[row_idx, 3]) else ""
-        
-        if "READINGS" in section_label.upper():
-            reading_start_row = row_idx + 1
-            break
-    
-    if reading_start_row is None:
-        return []
-    
-    # Find end of READINGS section
-    for offset in range(15):
-        row_idx = reading_start_row + offset
-        if row_idx >= len(df):
-            break
-        
-        section_label = str(df.iloc[row_idx, 3]).strip() if pd.notna(df.iloc[row_idx, 3]) else ""
-        
-        if any(keyword in section_label.upper() for keyword in ['ULLAGE', 'LOADS', 'CARRIER', 'NOTES']):
-            reading_end_row = row_idx
-            break
-    
-    if reading_end_row is None:
-        reading_end_row = reading_start_row + 10
-    
-    # Scan READINGS section
-    records = []
-    products_found = {}
-    
-    for row_idx in range(reading_start_row, reading_end_row):
-        if row_idx >= len(df):
-            break
-        
-        product_cell = df.iloc[row_idx, 4]
-        
-        if pd.notna(product_cell):
-            product = str(product_cell).strip()
-            
-            if any(key in product for key in ['87', '88', '91', 'dsl', 'racing', 'red']):
-                if product not in products_found:
-                    products_found[product] = []
-                
-                products_found[product].append(row_idx)
-    
-    # Extract readings for each date
-    for col_idx, date in date_columns:
-        for product, row_indices in products_found.items():
-            record = {
-                'Date': date.strftime('%Y-%m-%d'),
-                'City': city,
-                'Site': site_name,
-                'Product': product
-            }
-            
-            for tank_num, row_idx in enumerate(row_indices, start=1):
-                value = df.iloc[row_idx, col_idx]
-                
-                if pd.notna(value):
-                    try:
-                        clean_val = str(value).replace(',', '').strip()
-                        numeric_val = float(clean_val) if clean_val else None
-                        record[f'Tank_{tank_num}_Reading'] = numeric_val
-                    except:
-                        record[f'Tank_{tank_num}_Reading'] = None
-                else:
-                    record[f'Tank_{tank_num}_Reading'] = None
-            
-            records.append(record)
-    
-    return records
+def _label_column(arr, col):
+    """Upper-cased, stripped labels of one sheet column as a fixed-width str array ('' for missing cells)"""
+    cells = arr[:, col]
+    present = pd.notna(cells)
+    texts = np.char.strip(cells[present].astype(str))
+    
+    if texts.size and texts.view(np.uint32).max() >= 128:
+        # str.upper can lengthen non-ASCII text ('ß' -> 'SS'), which the fixed-width np.char.upper truncates
+        texts = np.array([text.upper() for text in texts.tolist()], dtype=str)
+    else:
+        texts = np.char.upper(texts)
+    
+    labels = np.zeros(len(cells), dtype=texts.dtype)
+    labels[present] = texts
+    return labels
 
-<<<<<<< HEAD
-def get_three_week_avg(df, site_row, site_name, all_dates, city):    
-=======
-def get_three_week_avg(df, site_row, site_name, all_dates):    
->>>>>>> 87e965b46c39f97ad5410632916b1d336604ff04
-    """Get 3-week average sales for a site"""
-    print(f" Getting 3-week average sales for {site_name}...")
-    avg_start_row = None
-    product_name = None
-    avg_end_row = None
-    for offset in range(200):
-        row_idx = site_row + offset
-        if row_idx >= len(df):
-            break
-        
-        section_label = str(df.iloc[row_idx-1, 3]).strip() if pd.notna(df.iloc[row_idx-1, 3]) else ""
-        avg_col = str(df.iloc[row_idx, 4]).strip() if pd.notna(df.iloc[row_idx, 4]) else ""
-<<<<<<< HEAD
-=======
 
+def _sheet_label_rows(arr):
+    """
+    Rows holding each section keyword, found with one scan of each label column per sheet
+    
+    Returns:
+        dict: {(label column, keyword): sorted ndarray of row indices}
+    """
+    labels = {col: _label_column(arr, col) for col in sorted({col for col, _ in SECTION_KEYWORDS})}
+    return {
+        (col, keyword): np.flatnonzero(np.char.find(labels[col], keyword) >= 0)
+        for col, keyword in SECTION_KEYWORDS
+    }
 
-        if "3 WK AVG" in avg_col.upper():
-            avg_start_row = row_idx + 1
-            break
-    
-    if avg_start_row is None:
-        return []
 
-    # Find end of Avg Section
-    for offset in range(200):
-        row_idx = avg_start_row + offset
-        if row_idx >= len(df):
-            break
-        
-        section_label = str(df.iloc[row_idx, 3]).strip() if pd.notna(df.iloc[row_idx, 3]) else ""
-        
-        if any(keyword in section_label.upper() for keyword in ['ACTUAL']):
-            avg_end_row = row_idx
-            break
+def _first_label_row(label_rows, start, stop, column_keywords):
+    """First row in [start, stop) where any (label column, keywords) pair matches, None if there is none"""
+    first = None
+    for col, keywords in column_keywords:
+        for keyword in keywords:
+            rows = label_rows[col, keyword]
+            pos = np.searchsorted(rows, start)
+            if pos < len(rows) and rows[pos] < stop and (first is None or rows[pos] < first):
+                first = int(rows[pos])
+    return first
+
+
+def _date_column_indices(date_columns):
+    """Sheet column index of every (col_idx, date, date_str) tuple from get_all_dates"""
+    return np.fromiter((col_idx for col_idx, _, _ in date_columns), dtype=np.intp, count=len(date_columns))
+
+
+def _parse_numbers(cells):
+    """
+    Vectorized float(str(cell).replace(',', '').strip()) over a row of raw sheet cells
+    
+    Returns:
+        (values, parsed): lists aligned with cells; values is None wherever parsed is
+        False (missing, blank or non-numeric cell)
+    """
+    cells = np.asarray(cells, dtype=object)
+    values = np.full(len(cells), None, dtype=object)
+    parsed = np.zeros(len(cells), dtype=bool)
+    
+    present = np.flatnonzero(pd.notna(cells))
+    if not len(present):
+        return values.tolist(), parsed.tolist()
+    
+    texts = np.char.strip(np.char.replace(cells[present].astype(str), ',', ''))
+    try:
+        # Whole-row cast, the common case when every present cell is a number
+        numbers = texts.astype(np.float64)
+        ok = np.ones(len(present), dtype=bool)
+    except ValueError:
+        numbers = np.full(len(present), np.nan)
+        ok = np.zeros(len(present), dtype=bool)
+        for i, text in enumerate(texts.tolist()):
+            try:
+                numbers[i] = float(text)
+                ok[i] = True
+            except ValueError:
+                pass
+    
+    # Scatter the parsed numbers back into place in one assignment
+    values[present[ok]] = numbers[ok]
+    parsed[present[ok]] = True
     
-    if avg_end_row is None:
-        avg_end_row = avg_start_row + 100
+    return values.tolist(), parsed.tolist()
 
-    records = []
-    products_found = {}
 
-    for row_idx in range(avg_start_row, avg_end_row):
-        if row_idx >= len(df):
-            break
-        
-        product_cell = df.iloc[row_idx-2, 4]
-        
-        if pd.notna(product_cell):
-            product = str(product_cell).strip()
+def _parse_block(arr, value_rows, date_columns):
+    """
+    _parse_numbers over the (value rows x date columns) block of the sheet, gathered with one fancy index
+    
+    Returns:
+        (values, parsed): one list per value row, aligned with date_columns
+    """
+    n_dates = len(date_columns)
+    if not n_dates:
+        return [[] for _ in value_rows], [[] for _ in value_rows]
+    
+    block = arr[np.ix_(np.asarray(value_rows, dtype=np.intp), _date_column_indices(date_columns))]
+    values, parsed = _parse_numbers(block.ravel())
+    
+    starts = range(0, len(values), n_dates)
+    return [values[i:i + n_dates] for i in starts], [parsed[i:i + n_dates] for i in starts]
 
-            if any(keyword in product for keyword in ['87', '88', '91', 'dsl', 'racing', 'red']):
-                if product not in products_found:
-                    products_found[product] = []
-                
-                products_found[product].append(row_idx)
-
-    for col_idx, date in all_dates:
-        for product, row_indices in products_found.items():
-            record = {
-                'Date': date.strftime('%Y-%m-%d'),
-                'Site': site_name,
-                'Product': product
-            }
-            for tank_num, row_idx in enumerate(row_indices, start=1):
-                value = df.iloc[row_idx-1, col_idx]
-                if pd.notna(value):
-                    try:
-                        clean_val = str(value).replace(',', '').strip()
-                        avg_val = float(clean_val) if clean_val else None
-                        record[f'Tank_{tank_num}_3_Week_Avg'] = avg_val
-                    except:
-                        record[f'Tank_{tank_num}_3_Week_Avg'] = None
-                else:
-                    record[f'Tank_{tank_num}_3_Week_Avg'] = None
-            
-            records.append(record)
 
-    return records
+def _row_count(columns):
+    """Number of rows in a dict of equal-length column lists"""
+    return len(next(iter(columns.values()), ()))
 
-def get_2_month_avg(df, site_row, site_name, all_dates):    
-    """Get 2-month average sales for a site"""
-    print(f" Getting 2-month average sales for {site_name}...")
-    avg_start_row = None
-    product_name = None
-    avg_end_row = None
-    for offset in range(200):
-        row_idx = site_row + offset
-        if row_idx >= len(df):
-            break
-        
-        section_label = str(df.iloc[row_idx-1, 3]).strip() if pd.notna(df.iloc[row_idx-1, 3]) else ""
-        avg_col = str(df.iloc[row_idx, 4]).strip() if pd.notna(df.iloc[row_idx, 4]) else ""
 
+def _concat_columns(parts):
+    """
+    Concatenate per-site column dicts into one preallocated object array per column
+    
+    Columns keep first-seen order; rows of a part lacking a column stay None. Parts
+    with no rows contribute nothing, not even their column names.
+    """
+    parts = [part for part in parts if _row_count(part)]
+    
+    names = {}
+    for part in parts:
+        for name in part:
+            names.setdefault(name, None)
+    
+    n_total = sum(_row_count(part) for part in parts)
+    columns = {name: np.empty(n_total, dtype=object) for name in names}  # np.empty fills object arrays with None
+    
+    pos = 0
+    for part in parts:
+        n_rows = _row_count(part)
+        for name, values in part.items():
+            columns[name][pos:pos + n_rows] = values
+        pos += n_rows
+    
+    return columns
 
-        if "2 MO AVG" in avg_col.upper():
-            avg_start_row = row_idx + 1
-            break
-    
-    if avg_start_row is None:
-        return []
 
-    # Find end of Avg Section
-    for offset in range(200):
-        row_idx = avg_start_row + offset
-        if row_idx >= len(df):
-            break
-        
-        section_label = str(df.iloc[row_idx, 3]).strip() if pd.notna(df.iloc[row_idx, 3]) else ""
-        
-        if any(keyword in section_label.upper() for keyword in ['ACTUAL']):
-            avg_end_row = row_idx
-            break
-    
-    if avg_end_row is None:
-        avg_end_row = avg_start_row + 100
+def _sort_order(columns, sort_by):
+    """Row order that stably sorts combined columns by the sort_by columns (as DataFrame.sort_values)"""
+    # Sort on categorical codes: factorize(sort=True) numbers each column's distinct values in sorted order
+    factorized = [pd.factorize(columns[name], sort=True) for name in sort_by]
+    # Missing values (-1) get the code after every real value, so they sort last as in sort_values
+    codes = [np.where(column_codes < 0, len(uniques), column_codes) for column_codes, uniques in factorized]
+    dims = [len(uniques) + 1 for _, uniques in factorized]
+    
+    # Fold the codes into one mixed-radix integer key so a single stable mergesort orders the rows;
+    # np.lexsort (keys last-to-first) is only needed if the key would overflow int64
+    if np.prod(dims, dtype=float) < 2 ** 63:
+        return np.argsort(np.ravel_multi_index(codes, dims), kind='stable')
+    return np.lexsort(codes[::-1])
 
-    records = []
-    products_found = {}
 
-    for row_idx in range(avg_start_row, avg_end_row):
-        if row_idx >= len(df):
-            break
-        
-        product_cell = df.iloc[row_idx-3, 4]
-        
-        if pd.notna(product_cell):
-            product = str(product_cell).strip()
-            
-            if any(key in product for key in ['87', '88', '91', 'dsl', 'racing', 'red']):
-                if product not in products_found:
-                    products_found[product] = []
-                
-                products_found[product].append(row_idx)
-
-    for col_idx, date in all_dates:
-        for product, row_indices in products_found.items():
-            record = {
-                'Date': date.strftime('%Y-%m-%d'),
-                'Site': site_name,
-                'Product': product
-            }
-            for tank_num, row_idx in enumerate(row_indices, start=1):
-                value = df.iloc[row_idx-1, col_idx]
-                if pd.notna(value):
-                    try:
-                        clean_val = str(value).replace(',', '').strip()
-                        avg_val = float(clean_val) if clean_val else None
-                        record[f'Tank_{tank_num}_2_Month_Avg'] = avg_val
-                    except:
-                        record[f'Tank_{tank_num}_2_Month_Avg'] = None
-                else:
-                    record[f'Tank_{tank_num}_2_Month_Avg'] = None
+def _write_csv(path, columns, sort_by):
+    """Write combined columns to a CSV, rows sorted by the sort_by columns"""
+    order = _sort_order(columns, sort_by)
+    # Reorder each column with one fancy index and zip the sorted columns into rows as they are
+    # written, rather than materializing every row tuple first and picking them out one by one
+    sorted_columns = [np.asarray(values, dtype=object)[order].tolist() for values in columns.values()]
+    
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, lineterminator=os.linesep)
+        writer.writerow(columns)
+        writer.writerows(zip(*sorted_columns))
 
-            records.append(record)
 
-    return records
->>>>>>> 87e965b46c39f97ad5410632916b1d336604ff04
+# Parquet column types; any column not listed (the value columns) is written as float64
+PARQUET_DTYPES = {
+    'Date': 'datetime64[ns]',
+    'City': 'category',
+    'Site': 'category',
+    'Product': 'category',
+    'Tank_Number': 'int16'
+}
 
 
-        if "3 WK AVG" in avg_col.upper():
-            avg_start_row = row_idx + 1
-            break
-    
-    if avg_start_row is None:
-        return []
+def _write_parquet(path, columns, sort_by):
+    """Write combined columns to a zstd-compressed Parquet file, rows sorted by the sort_by columns"""
+    order = _sort_order(columns, sort_by)
+    df = pd.DataFrame({name: np.asarray(values, dtype=object)[order] for name, values in columns.items()})
+    df = df.astype({name: PARQUET_DTYPES.get(name, 'float64') for name in df.columns})
+    df.to_parquet(path, engine='pyarrow', compression='zstd', index=False)
 
-    # Find end of Avg Section
-    for offset in range(200):
-        row_idx = avg_start_row + offset
-        if row_idx >= len(df):
-            break
-        
-        section_label = str(df.iloc[row_idx, 3]).strip() if pd.notna(df.iloc[row_idx, 3]) else ""
-        
-        if any(keyword in section_label.upper() for keyword in ['ACTUAL']):
-            avg_end_row = row_idx
-            break
-    
-    if avg_end_row is None:
-        avg_end_row = avg_start_row + 100
 
-    records = []
-    products_found = {}
+OUTPUT_WRITERS = {'parquet': ('.parquet', _write_parquet), 'csv': ('.csv', _write_csv)}
 
-    for row_idx in range(avg_start_row, avg_end_row):
-        if row_idx >= len(df):
-            break
-        
-        product_cell = df.iloc[row_idx-2, 4]
-        
-        if pd.notna(product_cell):
-            product = str(product_cell).strip()
 
-            if any(keyword in product for keyword in ['87', '88', '91', 'dsl', 'racing', 'red']):
-                if product not in products_found:
-                    products_found[product] = []
-                
-                products_found[product].append(row_idx)
-
-    for col_idx, date in all_dates:
-        for product, row_indices in products_found.items():
-            record = {
-                'Date': date.strftime('%Y-%m-%d'),
-                'City': city,
-                'Site': site_name,
-                'Product': product
-            }
-            for tank_num, row_idx in enumerate(row_indices, start=1):
-                value = df.iloc[row_idx-1, col_idx]
-                if pd.notna(value):
-                    try:
-                        clean_val = str(value).replace(',', '').strip()
-                        avg_val = float(clean_val) if clean_val else None
-                        record[f'Tank_{tank_num}_3_Week_Avg'] = avg_val
-                    except:
-                        record[f'Tank_{tank_num}_3_Week_Avg'] = None
-                else:
-                    record[f'Tank_{tank_num}_3_Week_Avg'] = None
-            
-            records.append(record)
+def _write_output(output_dir, name, columns, sort_by, output_format):
+    """Write one combined dataset as <name>.parquet or <name>.csv and return its path"""
+    extension, writer = OUTPUT_WRITERS[output_format]
+    path = os.path.join(output_dir, name + extension)
+    writer(path, columns, sort_by)
+    return path
 
-    return records
 
-def get_2_month_avg(df, site_row, site_name, all_dates, city):    
-    """Get 2-month average sales for a site"""
-    print(f" Getting 2-month average sales for {site_name}...")
-    avg_start_row = None
-    product_name = None
-    avg_end_row = None
-    for offset in range(200):
-        row_idx = site_row + offset
-        if row_idx >= len(df):
-            break
-        
-        section_label = str(df.iloc[row_idx-1, 3]).strip() if pd.notna(df.iloc[row_idx-1, 3]) else ""
-        avg_col = str(df.iloc[row_idx, 4]).strip() if pd.notna(df.iloc[row_idx, 4]) else ""
+def _tank_columns(date_columns, tank_values, city, site_name, tank_column):
+    """
+    Build the per-date, per-product tank columns (Date, City, Site, Product, Tank_N_...)
+    
+    Args:
+        date_columns: (col_idx, date, date_str) tuples from get_all_dates
+        tank_values: {product: [values per date column, one list per tank]}
+        tank_column: Tank column name with a {tank_num} placeholder
+    
+    Returns:
+        dict of column lists, one row per (date, product) in date-major order
+    """
+    products = list(tank_values)
+    n_rows = len(date_columns) * len(products)
+    if not n_rows:
+        return {}
+    
+    columns = {
+        'Date': [date_str for _, _, date_str in date_columns for _ in products],
+        'City': [city] * n_rows,
+        'Site': [site_name] * n_rows,
+        'Product': products * len(date_columns)
+    }
+    
+    # Products with fewer tanks than the widest one get None for the extra tank columns
+    n_tanks = max(len(tank_rows) for tank_rows in tank_values.values())
+    for tank_idx in range(n_tanks):
+        columns[tank_column.format(tank_num=tank_idx + 1)] = [
+            tank_rows[tank_idx][date_pos] if tank_idx < len(tank_rows) else None
+            for date_pos in range(len(date_columns))
+            for tank_rows in tank_values.values()
+        ]
+    
+    return columns
 
 
-        if "2 MO AVG" in avg_col.upper():
-            avg_start_row = row_idx + 1
-            break
-    
-    if avg_start_row is None:
-        return []
+def _long_tank_columns(date_columns, tank_values, city, site_name, value_column):
+    """
+    Build the per-date, per-tank columns (Date, City, Site, Product, Tank_Number, value)
+    
+    Args:
+        date_columns: (col_idx, date, date_str) tuples from get_all_dates
+        tank_values: {product: [values per date column, one list per tank]}
+        value_column: Name of the value column
+    
+    Returns:
+        dict of column lists, one row per (date, product, tank) in date-major order
+    """
+    tanks = [
+        (product, tank_num, row_values)
+        for product, tank_rows in tank_values.items()
+        for tank_num, row_values in enumerate(tank_rows, start=1)
+    ]
+    n_rows = len(date_columns) * len(tanks)
+    if not n_rows:
+        return {}
+    
+    return {
+        'Date': [date_str for _, _, date_str in date_columns for _ in tanks],
+        'City': [city] * n_rows,
+        'Site': [site_name] * n_rows,
+        'Product': [product for product, _, _ in tanks] * len(date_columns),
+        'Tank_Number': [tank_num for _, tank_num, _ in tanks] * len(date_columns),
+        value_column: [row_values[date_pos] for date_pos in range(len(date_columns)) for _, _, row_values in tanks]
+    }
 
-    # Find end of Avg Section
-    for offset in range(200):
-        row_idx = avg_start_row + offset
-        if row_idx >= len(df):
-            break
-        
-        section_label = str(df.iloc[row_idx, 3]).strip() if pd.notna(df.iloc[row_idx, 3]) else ""
-        
-        if any(keyword in section_label.upper() for keyword in ['ACTUAL']):
-            avg_end_row = row_idx
-            break
+
+def get_all_dates(arr, start_col=6):
+    """Extract all date columns from the sheet (up to today only) as (col_idx, date, 'YYYY-MM-DD') tuples"""
+    print("\nExtracting all dates...")
+    dates_row = arr[0, start_col:]
+    
+    today = pd.Timestamp.now().normalize()  # Get today's date at midnight
     
-    if avg_end_row is None:
-        avg_end_row = avg_start_row + 100
+    # Parse the whole header row in one call; blanks and non-date labels become NaT
+    parsed = pd.to_datetime(dates_row.astype(str), format='%b-%d-%y', errors='coerce')
+    keep = np.flatnonzero(parsed.notna() & (parsed <= today))  # Only include dates up to today
+    dates = parsed[keep]
+    # Output date strings are formatted once here, not once per product record in the extractors
+    date_data = list(zip((keep + start_col).tolist(), dates, dates.strftime('%Y-%m-%d')))
+    
+    print(f"✓ Found {len(date_data)} dates (up to today)")
+    if date_data:
+        print(f"  Date range: {date_data[0][1].date()} to {date_data[-1][1].date()}")
+    return date_data
 
-    records = []
-    products_found = {}
 
-    for row_idx in range(avg_start_row, avg_end_row):
-        if row_idx >= len(df):
-            break
-        
-        product_cell = df.iloc[row_idx-3, 4]
-        
-        if pd.notna(product_cell):
+def _section_rows(label_rows, site_row, spec):
+    """Locate a section's [start, end) rows below a site header, None if one of its anchors is missing"""
+    row = site_row
+    for step, (col, keywords, window) in enumerate(spec.anchors):
+        # Each further anchor is searched for after the previous one
+        search_start = row if step == 0 else row + 1
+        row = _first_label_row(label_rows, search_start, search_start + window, [(col, keywords)])
+        if row is None:
+            return None
+    
+    start = row + spec.start_offset
+    end = _first_label_row(label_rows, start + spec.end_window[0], start + spec.end_window[1], spec.end_labels)
+    
+    if end is None:
+        end = start + spec.default_rows
+    
+    return start, end
+
+
+def _section_products(col4, rows, product_offset=0):
+    """
+    Yield (row_idx, product, is_total) for the rows of a section whose product cell names a fuel product
+    
+    product is the _classify cache's copy of the label, so every row of a label shares one string object
+    """
+    # Slice the window once and walk it as a list; negative starts keep per-row indexing
+    first = rows.start + product_offset
+    cells = col4[first:rows.stop + product_offset].tolist() if first >= 0 else [col4[r + product_offset] for r in rows]
+    
+    for row_idx, product_cell in zip(rows, cells):
+        if product_cell is not None and product_cell == product_cell:
             product = str(product_cell).strip()
             
-            if any(key in product for key in ['87', '88', '91', 'dsl', 'racing', 'red']):
-                if product not in products_found:
-                    products_found[product] = []
-                
-                products_found[product].append(row_idx)
-
-    for col_idx, date in all_dates:
-        for product, row_indices in products_found.items():
-            record = {
-                'Date': date.strftime('%Y-%m-%d'),
-                'City': city,
-                'Site': site_name,
-                'Product': product
-            }
-            for tank_num, row_idx in enumerate(row_indices, start=1):
-                value = df.iloc[row_idx-1, col_idx]
-                if pd.notna(value):
-                    try:
-                        clean_val = str(value).replace(',', '').strip()
-                        avg_val = float(clean_val) if clean_val else None
-                        record[f'Tank_{tank_num}_2_Month_Avg'] = avg_val
-                    except:
-                        record[f'Tank_{tank_num}_2_Month_Avg'] = None
-                else:
-                    record[f'Tank_{tank_num}_2_Month_Avg'] = None
-
-            records.append(record)
+            base_product, is_total = _classify(product)
+            if base_product:
+                yield row_idx, base_product, is_total
 
-    return records
 
-def extract_site_loads(df, site_row, site_name, date_columns, city):
-    """Extract loads (fuel deliveries) for a single site"""
-    print(f"  Extracting LOADS for {site_name}...")
-    
-    # First, find ULLAGE section
-    ullage_row = None
-    for offset in range(30):
-        row_idx = site_row + offset
-        if row_idx >= len(df):
-            break
-        
-        section_label = str(df.iloc[row_idx, 3]).strip() if pd.notna(df.iloc[row_idx, 3]) else ""
+def _section_tank_values(arr, rows, spec, date_columns):
+    """{product: [values per date column, one list per tank]} for a section with one tank per product row"""
+    products_found = {}
+    for row_idx, product, _ in _section_products(arr[:, 4], rows, spec.product_offset):
+        if product not in products_found:
+            products_found[product] = []
         
-        if "ULLAGE" in section_label.upper():
-            ullage_row = row_idx
-            break
+        products_found[product].append(row_idx)
     
-    if ullage_row is None:
-        return []
+    if not products_found:
+        return {}
     
-    # Now find LOADS section AFTER ullage
-    loads_start_row = None
-    loads_end_row = None
+    # Parse every tank's value row across all date columns at once
+    tanks = [(product, row_idx + spec.value_offset) for product, row_indices in products_found.items() for row_idx in row_indices]
+    values, _ = _parse_block(arr, [value_row for _, value_row in tanks], date_columns)
     
-    for offset in range(1, 20):  # Start searching after ullage
-        row_idx = ullage_row + offset
-        if row_idx >= len(df):
-            break
-        
-        section_label = str(df.iloc[row_idx, 3]).strip() if pd.notna(df.iloc[row_idx, 3]) else ""
-        
-        if "LOADS" in section_label.upper():
-            loads_start_row = row_idx
-            break
-    
-    if loads_start_row is None:
-        return []
-    
-    # Find end of LOADS section
-    for offset in range(1, 15):
-        row_idx = loads_start_row + offset
-        if row_idx >= len(df):
-            break
-        
-        section_label = str(df.iloc[row_idx, 3]).strip() if pd.notna(df.iloc[row_idx, 3]) else ""
-        col1_label = str(df.iloc[row_idx, 1]).strip() if pd.notna(df.iloc[row_idx, 1]) else ""
-        
-        if any(keyword in section_label.upper() for keyword in ['SALES', 'CARRIER', 'NOTES']) or \
-           any(keyword in col1_label.upper() for keyword in ['SALES', 'CARRIER']):
-            loads_end_row = row_idx
-            break
-    
-    if loads_end_row is None:
-        loads_end_row = loads_start_row + 10
+    tank_values = {}
+    for (product, _), row_values in zip(tanks, values):
+        tank_values.setdefault(product, []).append(row_values)
     
-    # Scan LOADS section - get product rows
-    records = []
+    return tank_values
+
+
+def _tank_section_columns(arr, rows, spec, site_name, date_columns, city):
+    """Per-date tank values (sales averages), one Tank_N column per tank"""
+    tank_values = _section_tank_values(arr, rows, spec, date_columns)
+    return _tank_columns(date_columns, tank_values, city, site_name, spec.value_column)
+
+
+def _long_tank_section_columns(arr, rows, spec, site_name, date_columns, city):
+    """Per-date tank values (readings) in long format, one row per tank with its Tank_Number"""
+    tank_values = _section_tank_values(arr, rows, spec, date_columns)
+    return _long_tank_columns(date_columns, tank_values, city, site_name, spec.value_column)
+
+
+def _load_section_columns(arr, rows, spec, site_name, date_columns, city):
+    """Per-date load totals, one row per product (its total row if it has one)"""
+    # Capture all product rows (prefer total if exists, otherwise take the row)
     products_found = {}
-    
-    for row_idx in range(loads_start_row, loads_end_row):
-        if row_idx >= len(df):
-            break
+    for row_idx, base_product, is_total in _section_products(arr[:, 4], rows, spec.product_offset):
+        # If we haven't seen this product yet, or this is a total row, store it
+        if base_product not in products_found or is_total:
+            products_found[base_product] = row_idx
+    
+    if not products_found:
+        return {}
+    
+    # Parse every product's load row across all date columns at once
+    values, parsed = _parse_block(arr, [row_idx + spec.value_offset for row_idx in products_found.values()], date_columns)
+    product_loads = dict(zip(products_found, zip(values, parsed)))
+    
+    # Extract loads for each date (only totals) - the parsed cells of the (date, product) grid,
+    # located in date-major order with one nonzero() pass instead of a per-cell Python loop
+    columns = {'Date': [], 'City': [], 'Site': [], 'Product': [], spec.value_column: []}
+    if product_loads and date_columns:
+        products = np.array(list(product_loads), dtype=object)
+        date_strs = np.array([date_str for _, _, date_str in date_columns], dtype=object)
+        load_values = np.array([values for values, _ in product_loads.values()], dtype=object)
+        parsed_grid = np.array([parsed for _, parsed in product_loads.values()], dtype=bool)
         
-        product_cell = df.iloc[row_idx, 4]
-        
-        if pd.notna(product_cell):
-            product = str(product_cell).strip()
-            
-            # Get base product (87, 88, racing, red 91, dsl)
-            base_product = None
-            if any(keyword in product for keyword in ['87', '88', '91', 'dsl', 'racing', 'red']):
-                base_product = product
-            
-            # Capture all product rows (prefer total if exists, otherwise take the row)
-            if base_product:
-                is_total = "total" in product.lower()
-                # If we haven't seen this product yet, or this is a total row, store it
-                if base_product not in products_found or is_total:
-                    products_found[base_product] = row_idx
-    
-    # Extract loads for each date (only totals)
-    for col_idx, date in date_columns:
-        for product, row_idx in products_found.items():
-            value = df.iloc[row_idx, col_idx]
-            
-            if pd.notna(value):
-                try:
-                    clean_val = str(value).replace(',', '').strip()
-                    load_val = float(clean_val) if clean_val else None
-                    
-                    if load_val is not None:
-                        records.append({
-                            'Date': date.strftime('%Y-%m-%d'),
-                            'City': city,
-                            'Site': site_name,
-                            'Product': product,
-                            'Load_Total': load_val
-                        })
-                except:
-                    pass
-    
-    return records
-
-<<<<<<< HEAD
-def extract_site_tank_sizes(df, site_row, site_name, city):
-=======
-def extract_site_tank_sizes(df, site_row, site_name):
->>>>>>> 87e965b46c39f97ad5410632916b1d336604ff04
-    """Extract tank sizes for a single site"""
-    print(f"  Extracting TANK SIZES for {site_name}...")
+        date_pos, product_pos = np.nonzero(parsed_grid.T)
+        columns['Date'] = date_strs[date_pos].tolist()
+        columns['Product'] = products[product_pos].tolist()
+        columns[spec.value_column] = load_values[product_pos, date_pos].tolist()
     
-    # Find TANK SIZE label
-    tank_size_row = None
-    
-    for offset in range(40):
-        row_idx = site_row + offset
-        if row_idx >= len(df):
-            break
-        
-        label = str(df.iloc[row_idx, 1]).strip() if pd.notna(df.iloc[row_idx, 1]) else ""
-        
-        if "TANK SIZE" in label.upper():
-            tank_size_row = row_idx
-            break
+    n_rows = len(columns['Date'])
+    columns['City'] = [city] * n_rows
+    columns['Site'] = [site_name] * n_rows
     
-    if tank_size_row is None:
-        return []
+    return columns
+
+
+def _level_section_columns(arr, rows, spec, site_name, date_columns, city):
+    """Per-tank levels read from column 1 (tank sizes and inventory settings)"""
+    col1 = arr[:, 1]
     
-    # Extract tank sizes - first pass to collect all rows
-    records = []
+    # First pass to collect all rows
     products_data = {}  # {base_product: {'total': (row_idx, value), 'singles': [(row_idx, value), ...]}}
     
-    for row_idx in range(tank_size_row + 1, tank_size_row + 20):
-        if row_idx >= len(df):
-            break
-        
-        col1_label = str(df.iloc[row_idx, 1]).strip() if pd.notna(df.iloc[row_idx, 1]) else ""
-        col3_label = str(df.iloc[row_idx, 3]).strip() if pd.notna(df.iloc[row_idx, 3]) else ""
-        
-        if "SALES" in col1_label.upper() or "SALES" in col3_label.upper():
-            break
+    for row_idx, product, is_total in _section_products(arr[:, 4], rows, spec.product_offset):
+        level = col1[row_idx]
+        if level is None or level != level:
+            continue
         
-        tank_size = df.iloc[row_idx, 1]
-        product_cell = df.iloc[row_idx, 4]
+        # Get base product name (without "total")
+        base_product = product.lower().replace("total", "").strip() if is_total else product
         
-        if pd.notna(tank_size) and pd.notna(product_cell):
-            product = str(product_cell).strip()
+        try:
+            clean_val = str(level).replace(',', '').strip()
+            level_val = float(clean_val) if clean_val else None
             
-<<<<<<< HEAD
-            # Check if this product is relevant
-            if any(keyword in product for keyword in ['87', '88', '91', 'dsl', 'racing', 'red']):
-                is_total = "total" in product.lower()
-                # Get base product name (without "total")
-                base_product = product.lower().replace("total", "").strip() if is_total else product
+            if level_val and level_val > 0:
+                if base_product not in products_data:
+                    products_data[base_product] = {'total': None, 'singles': []}
                 
-=======
-            # Extract base product
-            base_product = None
-            if any(keyword in product for keyword in ['87', '88', '91', 'dsl', 'racing', 'red']):
-                base_product = product
-            
-            if base_product:
->>>>>>> 87e965b46c39f97ad5410632916b1d336604ff04
-                try:
-                    clean_val = str(tank_size).replace(',', '').strip()
-                    size_val = float(clean_val) if clean_val else None
-                    
-                    if size_val and size_val > 0:
-                        if base_product not in products_data:
-                            products_data[base_product] = {'total': None, 'singles': []}
-                        
-                        if is_total:
-                            products_data[base_product]['total'] = (row_idx, size_val)
-                        else:
-                            products_data[base_product]['singles'].append((row_idx, size_val))
-                except:
-                    pass
-    
-    # Second pass: create records - use singles if they exist, otherwise use total
+                if is_total:
+                    products_data[base_product]['total'] = (row_idx, level_val)
+                else:
+                    products_data[base_product]['singles'].append((row_idx, level_val))
+        except:
+            pass
+    
+    # Second pass: create rows - use singles if they exist, otherwise use total
+    columns = {'City': [], 'Site': [], 'Product': [], 'Tank_Number': [], spec.value_column: []}
     for base_product, data in products_data.items():
         if data['singles']:  # If we have individual tanks, use those
-            for tank_num, (row_idx, size_val) in enumerate(data['singles'], start=1):
-                records.append({
-                    'City': city,
-                    'Site': site_name,
-                    'Product': base_product,
-                    'Tank_Number': tank_num,
-                    'Tank_Size': size_val
-                })
+            tanks = [(tank_num, level_val) for tank_num, (row_idx, level_val) in enumerate(data['singles'], start=1)]
         elif data['total']:  # If we only have total, use that
-            row_idx, size_val = data['total']
-            records.append({
-                'City': city,
-                'Site': site_name,
-                'Product': base_product,
-                'Tank_Number': 1,
-                'Tank_Size': size_val
-            })
+            tanks = [(1, data['total'][1])]
+        else:
+            continue
+        
+        for tank_num, level_val in tanks:
+            columns['Product'].append(base_product)
+            columns['Tank_Number'].append(tank_num)
+            columns[spec.value_column].append(level_val)
     
-    return records
+    n_rows = len(columns['Product'])
+    columns['City'] = [city] * n_rows
+    columns['Site'] = [site_name] * n_rows
+    
+    return columns
+
+
+# Section layouts below each site header:
+#   anchors       - (label column, keywords, rows to search) steps locating the section label
+#   start_offset  - first data row, relative to the last anchor
+#   end_labels    - (label column, keywords) pairs, any of which marks the end of the section
+#   end_window    - (first, stop) rows searched for end_labels, relative to the start
+#   default_rows  - section length when no end label is found
+#   product_offset/value_offset - row offsets of the product cell and the value row from a data row
+SectionSpec = namedtuple('SectionSpec', [
+    'anchors', 'start_offset', 'end_labels', 'end_window', 'default_rows',
+    'product_offset', 'value_offset', 'value_column', 'build'
+])
+
+READINGS_SECTION = SectionSpec(
+    anchors=[(3, ['READINGS'], 20)], start_offset=1,
+    end_labels=[(3, ['ULLAGE', 'LOADS', 'CARRIER', 'NOTES'])], end_window=(0, 15), default_rows=10,
+    product_offset=0, value_offset=0, value_column='Reading', build=_long_tank_section_columns
+)
+THREE_WEEK_AVG_SECTION = SectionSpec(
+    anchors=[(4, ['3 WK AVG'], 200)], start_offset=1,
+    end_labels=[(3, ['ACTUAL'])], end_window=(0, 200), default_rows=100,
+    product_offset=-2, value_offset=-1, value_column='Tank_{tank_num}_3_Week_Avg', build=_tank_section_columns
+)
+TWO_MONTH_AVG_SECTION = SectionSpec(
+    anchors=[(4, ['2 MO AVG'], 200)], start_offset=1,
+    end_labels=[(3, ['ACTUAL'])], end_window=(0, 200), default_rows=100,
+    product_offset=-3, value_offset=-1, value_column='Tank_{tank_num}_2_Month_Avg', build=_tank_section_columns
+)
+# LOADS is the first LOADS label after ULLAGE
+LOADS_SECTION = SectionSpec(
+    anchors=[(3, ['ULLAGE'], 30), (3, ['LOADS'], 19)], start_offset=0,
+    end_labels=[(3, ['SALES', 'CARRIER', 'NOTES']), (1, ['SALES', 'CARRIER'])], end_window=(1, 15), default_rows=10,
+    product_offset=0, value_offset=0, value_column='Load_Total', build=_load_section_columns
+)
+TANK_SIZES_SECTION = SectionSpec(
+    anchors=[(1, ['TANK SIZE'], 40)], start_offset=1,
+    end_labels=[(1, ['SALES']), (3, ['SALES'])], end_window=(0, 19), default_rows=19,
+    product_offset=0, value_offset=0, value_column='Tank_Size', build=_level_section_columns
+)
+INV_SETTINGS_SECTION = SectionSpec(
+    anchors=[(1, ['INV. SETTING', 'INV SETTING'], 20)], start_offset=1,
+    end_labels=[(1, ['TANK SIZE'])], end_window=(0, 19), default_rows=19,
+    product_offset=0, value_offset=0, value_column='Desired_Level', build=_level_section_columns
+)
+
+SECTIONS = [
+    READINGS_SECTION, THREE_WEEK_AVG_SECTION, TWO_MONTH_AVG_SECTION,
+    LOADS_SECTION, TANK_SIZES_SECTION, INV_SETTINGS_SECTION
+]
+
+# Every (label column, keyword) any section searches for, located once per sheet by _sheet_label_rows
+SECTION_KEYWORDS = sorted({
+    (col, keyword)
+    for spec in SECTIONS
+    for col, keywords in [(col, keywords) for col, keywords, _ in spec.anchors] + spec.end_labels
+    for keyword in keywords
+})
+
+
+def _site_has_sections(label_rows, site_row):
+    """Whether any section can be located below a site header - a block with none yields no rows at all"""
+    return any(_section_rows(label_rows, site_row, spec) is not None for spec in SECTIONS)
+
+
+def _extract_section(arr, label_rows, site_row, site_name, date_columns, city, spec):
+    """Find one section of a site by its spec and build its output columns"""
+    bounds = _section_rows(label_rows, site_row, spec)
+    if bounds is None:
+        return {}
+    
+    start, end = bounds
+    rows = range(start, min(end, len(arr)))
+    if not rows:
+        return {}
+    
+    return spec.build(arr, rows, spec, site_name, date_columns, city)
+
+
+def extract_site_readings(arr, label_rows, site_row, site_name, date_columns, city):
+    """Extract readings for a single site"""
+    print(f"  Extracting READINGS for {site_name}...")
+    return _extract_section(arr, label_rows, site_row, site_name, date_columns, city, READINGS_SECTION)
+
+def get_three_week_avg(arr, label_rows, site_row, site_name, all_dates, city):    
+    """Get 3-week average sales for a site"""
+    print(f" Getting 3-week average sales for {site_name}...")
+    return _extract_section(arr, label_rows, site_row, site_name, all_dates, city, THREE_WEEK_AVG_SECTION)
+
+def get_2_month_avg(arr, label_rows, site_row, site_name, all_dates, city):    
+    """Get 2-month average sales for a site"""
+    print(f" Getting 2-month average sales for {site_name}...")
+    return _extract_section(arr, label_rows, site_row, site_name, all_dates, city, TWO_MONTH_AVG_SECTION)
+
+def extract_site_loads(arr, label_rows, site_row, site_name, date_columns, city):
+    """Extract loads (fuel deliveries) for a single site"""
+    print(f"  Extracting LOADS for {site_name}...")
+    return _extract_section(arr, label_rows, site_row, site_name, date_columns, city, LOADS_SECTION)
+
+def extract_site_tank_sizes(arr, label_rows, site_row, site_name, city):
+    """Extract tank sizes for a single site"""
+    print(f"  Extracting TANK SIZES for {site_name}...")
+    return _extract_section(arr, label_rows, site_row, site_name, None, city, TANK_SIZES_SECTION)
 
 
 # def extract_site_sales_actual(df, site_row, site_name, date_columns):
@@ -774,98 +772,45 @@ def extract_site_tank_sizes(df, site_row, site_name):
 #     return records
 
 
-def extract_site_inv_settings(df, site_row, site_name, city):
+def extract_site_inv_settings(arr, label_rows, site_row, site_name, city):
     """Extract inventory settings for a single site"""
     print(f"  Extracting INV SETTINGS for {site_name}...")
-    
-    # Find INV SETTING label
-    inv_setting_row = None
-    
-    for offset in range(20):
-        row_idx = site_row + offset
-        if row_idx >= len(df):
-            break
-        
-        label = str(df.iloc[row_idx, 1]).strip() if pd.notna(df.iloc[row_idx, 1]) else ""
-        
-        if "INV. SETTING" in label.upper() or "INV SETTING" in label.upper():
-            inv_setting_row = row_idx
-            break
-    
-    if inv_setting_row is None:
-        return []
-    
-    # Extract inventory settings - first pass to collect all rows
-    records = []
-    products_data = {}  # {base_product: {'total': (row_idx, value), 'singles': [(row_idx, value), ...]}}
-    
-    for row_idx in range(inv_setting_row + 1, inv_setting_row + 20):
-        if row_idx >= len(df):
-            break
-        
-        col1_label = str(df.iloc[row_idx, 1]).strip() if pd.notna(df.iloc[row_idx, 1]) else ""
-        
-        if "TANK SIZE" in col1_label.upper():
-            break
-        
-        desired_level = df.iloc[row_idx, 1]
-        product_cell = df.iloc[row_idx, 4]
+    return _extract_section(arr, label_rows, site_row, site_name, None, city, INV_SETTINGS_SECTION)
+
+
+def _site_extractor(arr, label_rows, all_dates, city):
+    """Build the per-site extraction for one sheet, with the sheet bound into the closure"""
+    def extract_site(site):
+        """Run every extractor for one (site_row, site_name), None for an empty site block"""
+        site_row, site_name = site
+        if not _site_has_sections(label_rows, site_row):
+            return None
         
-        if pd.notna(desired_level) and pd.notna(product_cell):
-            product = str(product_cell).strip()
-            
-<<<<<<< HEAD
-            # Check if this product is relevant
-            if any(keyword in product for keyword in ['87', '88', '91', 'dsl', 'racing', 'red']):
-                is_total = "total" in product.lower()
-                # Get base product name (without "total")
-                base_product = product.lower().replace("total", "").strip() if is_total else product
-                
-=======
-            # Extract base product
-            base_product = None
-            if any(keyword in product for keyword in ['87', '88', '91', 'dsl', 'racing', 'red']):
-                base_product = product
-            
-            if base_product:
->>>>>>> 87e965b46c39f97ad5410632916b1d336604ff04
-                try:
-                    clean_val = str(desired_level).replace(',', '').strip()
-                    level_val = float(clean_val) if clean_val else None
-                    
-                    if level_val and level_val > 0:
-                        if base_product not in products_data:
-                            products_data[base_product] = {'total': None, 'singles': []}
-                        
-                        if is_total:
-                            products_data[base_product]['total'] = (row_idx, level_val)
-                        else:
-                            products_data[base_product]['singles'].append((row_idx, level_val))
-                except:
-                    pass
-    
-    # Second pass: create records - use singles if they exist, otherwise use total
-    for base_product, data in products_data.items():
-        if data['singles']:  # If we have individual tanks, use those
-            for tank_num, (row_idx, level_val) in enumerate(data['singles'], start=1):
-                records.append({
-                    'City': city,
-                    'Site': site_name,
-                    'Product': base_product,
-                    'Tank_Number': tank_num,
-                    'Desired_Level': level_val
-                })
-        elif data['total']:  # If we only have total, use that
-            row_idx, level_val = data['total']
-            records.append({
-                'City': city,
-                'Site': site_name,
-                'Product': base_product,
-                'Tank_Number': 1,
-                'Desired_Level': level_val
-            })
-    
-    return records
+        return (
+            extract_site_readings(arr, label_rows, site_row, site_name, all_dates, city),
+            extract_site_loads(arr, label_rows, site_row, site_name, all_dates, city),
+            extract_site_tank_sizes(arr, label_rows, site_row, site_name, city),
+            extract_site_inv_settings(arr, label_rows, site_row, site_name, city),
+            get_three_week_avg(arr, label_rows, site_row, site_name, all_dates, city),
+            get_2_month_avg(arr, label_rows, site_row, site_name, all_dates, city),
+        )
+    
+    return extract_site
+
+
+# Per-site extraction for the sheet being processed, built once per worker process by _init_site_worker
+_worker_extract_site = None
+
+
+def _init_site_worker(arr, label_rows, all_dates, city):
+    """Pool initializer - receive the sheet once per worker instead of once per site"""
+    global _worker_extract_site
+    _worker_extract_site = _site_extractor(arr, label_rows, all_dates, city)
+
+
+def _extract_site(site):
+    """Pool task - extract one (site_row, site_name) against the worker's sheet"""
+    return _worker_extract_site(site)
 
 
 def main():
@@ -873,7 +818,14 @@ def main():
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='Extract fuel data from Google Sheets')
     parser.add_argument('--output', '-o', type=str, default=DEFAULT_OUTPUT_DIR,
-                        help=f'Output directory for CSV files (default: {DEFAULT_OUTPUT_DIR})')
+                        help=f'Output directory for the extracted files (default: {DEFAULT_OUTPUT_DIR})')
+    parser.add_argument('--format', '-f', choices=list(OUTPUT_WRITERS), default='parquet',
+                        help='Output file format; use csv for spreadsheet tools such as Excel (default: parquet)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help=f'Always re-download the sheets instead of reusing unchanged ones from {CACHE_DIR}')
+    parser.add_argument('--workers', '-w', type=int, default=1,
+                        help='Worker processes used to extract sites in parallel; each one gets its own copy '
+                             'of the sheet, so this only pays off on very large sheets (default: 1, in-process)')
     args = parser.parse_args()
     
     output_dir = args.output
@@ -888,7 +840,7 @@ def main():
     print("="*80)
     print(f"Output directory: {output_dir}")
     
-    # Initialize combined data containers
+    # Initialize combined data containers (per-site column dicts, concatenated once at export)
     all_readings = []
     all_loads = []
     all_tank_sizes = []
@@ -896,7 +848,7 @@ def main():
     all_sales_actual = []
     all_three_week_avg = []
     all_2_month_avg = []
-<<<<<<< HEAD
+    skipped_sites = 0
     
     # Process both sheets
     sheets_to_process = [
@@ -904,25 +856,44 @@ def main():
         (RENO_SHEET, "RENO")
     ]
     
+    # Download every sheet concurrently up front; each city is then processed, in order,
+    # as soon as its own fetch is done
+    fetch_pool = ThreadPoolExecutor(max_workers=len(sheets_to_process))
+    fetches = [
+        fetch_pool.submit(fetch_data, sheet_url, city_name, use_cache=not args.no_cache)
+        for sheet_url, city_name in sheets_to_process
+    ]
+    
     for sheet_url, city_name in sheets_to_process:
+        # Popped, so a finished future does not keep its city's DataFrame alive for the whole run
+        fetch = fetches.pop(0)
+        
         print(f"\n{'='*80}")
         print(f"PROCESSING {city_name} DATA")
         print('='*80)
         
         # Fetch data with error handling
         try:
-            df = fetch_data(sheet_url, city_name)
+            df = fetch.result()
         except Exception as e:
             print(f"❌ Failed to fetch {city_name} data: {e}")
             print(f"   Skipping {city_name} and continuing with other cities...")
             continue
         
+        # Raw cell grid shared by every extractor, plain ndarray indexing instead of .iloc.
+        # Column-major, so the label/product column scans read contiguous memory
+        arr = np.asfortranarray(df.to_numpy(dtype=object))
+        label_rows = _sheet_label_rows(arr)
+        
         # Dynamically identify all sites
         print("\n" + "="*80)
         print(f"IDENTIFYING SITES IN {city_name}")
         print("="*80)
         sites = identify_sites(df)
         
+        # Everything below reads the ndarray copy; release the DataFrame before extraction
+        del df, fetch
+        
         if not sites:
             print(f"✗ No sites found in {city_name} data!")
             continue
@@ -930,131 +901,119 @@ def main():
         print(f"\n✓ Will extract data for {len(sites)} sites in {city_name}")
         
         # Get all dates
-        all_dates = get_all_dates(df)
+        all_dates = get_all_dates(arr)
         
         # Extract data for all sites
         print(f"\n{'='*80}")
         print(f"EXTRACTING DATA FOR ALL {city_name} SITES")
         print('='*80)
 
-        for site_row, site_name in sites:
+        if args.workers > 1:
+            # Opt-in: sites are independent, so extract them in parallel; map() keeps results in site order.
+            # Workers are spawned, not forked - forking after pyarrow/requests have started threads can deadlock
+            with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context('spawn'),
+                                     initializer=_init_site_worker,
+                                     initargs=(arr, label_rows, all_dates, city_name)) as executor:
+                site_results = list(executor.map(_extract_site, sites))
+        else:
+            # Per-site work is a few milliseconds of vectorized code; a plain loop beats paying for
+            # worker start-up and a pickled copy of the grid, and keeps the progress output in order
+            extract_site = _site_extractor(arr, label_rows, all_dates, city_name)
+            site_results = [extract_site(site) for site in sites]
+            del extract_site
+        
+        # Extraction is done with the sheet grid, free it before the next city's is built
+        del arr, label_rows
+        
+        for (site_row, site_name), site_result in zip(sites, site_results):
+            if site_result is None:
+                print(f"\n{site_name}: no data sections found, skipped")
+                skipped_sites += 1
+                continue
+            
+            readings, loads, tank_sizes, inv_settings, three_week_avg, two_month_avg = site_result
             print(f"\n{site_name}:")
             
-            # Extract readings
-            readings = extract_site_readings(df, site_row, site_name, all_dates, city_name)
-            all_readings.extend(readings)
-            print(f"    ✓ {len(readings)} reading records")
+            all_readings.append(readings)
+            print(f"    ✓ {_row_count(readings)} reading records")
             
-            # Extract loads
-            loads = extract_site_loads(df, site_row, site_name, all_dates, city_name)
-            all_loads.extend(loads)
-            print(f"    ✓ {len(loads)} load records")
+            all_loads.append(loads)
+            print(f"    ✓ {_row_count(loads)} load records")
             
-            # Extract tank sizes
-            tank_sizes = extract_site_tank_sizes(df, site_row, site_name, city_name)
-            all_tank_sizes.extend(tank_sizes)
-            print(f"    ✓ {len(tank_sizes)} tank size records")
+            all_tank_sizes.append(tank_sizes)
+            print(f"    ✓ {_row_count(tank_sizes)} tank size records")
             
-            # Extract inv settings
-            inv_settings = extract_site_inv_settings(df, site_row, site_name, city_name)
-            all_inv_settings.extend(inv_settings)
-            print(f"    ✓ {len(inv_settings)} inv setting records")
+            all_inv_settings.append(inv_settings)
+            print(f"    ✓ {_row_count(inv_settings)} inv setting records")
             
             # # Extract sales actual
             # sales_actual = extract_site_sales_actual(df, site_row, site_name, all_dates, city_name)
             # all_sales_actual.extend(sales_actual)
             # print(f"    ✓ {len(sales_actual)} sales actual records")
 
-            # Extract 3-week average
-            three_week_avg = get_three_week_avg(df, site_row, site_name, all_dates, city_name)
-            all_three_week_avg.extend(three_week_avg)
-            print(f"    ✓ {len(three_week_avg)} 3-week average records")
+            all_three_week_avg.append(three_week_avg)
+            print(f"    ✓ {_row_count(three_week_avg)} 3-week average records")
 
-            # Extract 2-month average
-            two_month_avg = get_2_month_avg(df, site_row, site_name, all_dates, city_name)
-            all_2_month_avg.extend(two_month_avg)
-            print(f"    ✓ {len(two_month_avg)} 2-month average records")
-=======
+            all_2_month_avg.append(two_month_avg)
+            print(f"    ✓ {_row_count(two_month_avg)} 2-month average records")
 
-    for site_row, site_name in sites:
-        print(f"\n{site_name}:")
-        
-        # Extract readings
-        readings = extract_site_readings(df, site_row, site_name, all_dates)
-        all_readings.extend(readings)
-        print(f"    ✓ {len(readings)} reading records")
-        
-        # Extract loads
-        loads = extract_site_loads(df, site_row, site_name, all_dates)
-        all_loads.extend(loads)
-        print(f"    ✓ {len(loads)} load records")
-        
-        # Extract tank sizes
-        tank_sizes = extract_site_tank_sizes(df, site_row, site_name)
-        all_tank_sizes.extend(tank_sizes)
-        print(f"    ✓ {len(tank_sizes)} tank size records")
-        
-        # Extract inv settings
-        inv_settings = extract_site_inv_settings(df, site_row, site_name)
-        all_inv_settings.extend(inv_settings)
-        print(f"    ✓ {len(inv_settings)} inv setting records")
-        
-        # # Extract sales actual
-        # sales_actual = extract_site_sales_actual(df, site_row, site_name, all_dates)
-        # all_sales_actual.extend(sales_actual)
-        # print(f"    ✓ {len(sales_actual)} sales actual records")
-
-        # Extract 3-week average
-        three_week_avg = get_three_week_avg(df, site_row, site_name, all_dates)
-        all_three_week_avg.extend(three_week_avg)
-        print(f"    ✓ {len(three_week_avg)} 3-week average records")
-
-        # Extract 2-month average
-        two_month_avg = get_2_month_avg(df, site_row, site_name, all_dates)
-        all_2_month_avg.extend(two_month_avg)
-        print(f"    ✓ {len(two_month_avg)} 2-month average records")
->>>>>>> 87e965b46c39f97ad5410632916b1d336604ff04
-
-    # Convert to DataFrames and export
+    fetch_pool.shutdown()
+    
+    # Sort and export the combined columns
     print(f"\n{'='*80}")
     print("EXPORTING DATA")
     print('='*80)
     
+    all_readings = _concat_columns(all_readings)
+    all_loads = _concat_columns(all_loads)
+    all_tank_sizes = _concat_columns(all_tank_sizes)
+    all_inv_settings = _concat_columns(all_inv_settings)
+    all_three_week_avg = _concat_columns(all_three_week_avg)
+    all_2_month_avg = _concat_columns(all_2_month_avg)
+    
+    # Write every non-empty dataset at once on a thread pool, so the file writes overlap (pyarrow's
+    # Parquet encoder also releases the GIL); results are reported below in the usual order
+    exports = {
+        'fuel_readings': (all_readings, ['Date', 'City', 'Site', 'Product', 'Tank_Number']),
+        'fuel_loads': (all_loads, ['Date', 'City', 'Site', 'Product']),
+        'tank_sizes': (all_tank_sizes, ['City', 'Site', 'Product', 'Tank_Number']),
+        'inv_settings': (all_inv_settings, ['City', 'Site', 'Product', 'Tank_Number']),
+        'three_week_avg': (all_three_week_avg, ['Date', 'City', 'Site', 'Product']),
+        'two_month_avg': (all_2_month_avg, ['Date', 'City', 'Site', 'Product'])
+    }
+    with ThreadPoolExecutor(max_workers=len(exports)) as write_pool:
+        written = {
+            name: write_pool.submit(_write_output, output_dir, name, columns, sort_by, args.format)
+            for name, (columns, sort_by) in exports.items() if _row_count(columns)
+        }
+    
     # 1. READINGS
-    df_readings = pd.DataFrame(all_readings)
-    if not df_readings.empty:
-        df_readings = df_readings.sort_values(['Date', 'City', 'Site', 'Product'])
-        readings_file = os.path.join(output_dir, 'fuel_readings.csv')
-        df_readings.to_csv(readings_file, index=False)
+    n_readings = _row_count(all_readings)
+    if n_readings:
+        readings_file = written['fuel_readings'].result()
         print(f"✓ READINGS: {readings_file}")
-        print(f"  {len(df_readings)} records | {df_readings['Date'].min()} to {df_readings['Date'].max()}")
+        print(f"  {n_readings} records | {min(all_readings['Date'])} to {max(all_readings['Date'])}")
     
     # 2. LOADS
-    df_loads = pd.DataFrame(all_loads)
-    if not df_loads.empty:
-        df_loads = df_loads.sort_values(['Date', 'City', 'Site', 'Product'])
-        loads_file = os.path.join(output_dir, 'fuel_loads.csv')
-        df_loads.to_csv(loads_file, index=False)
+    n_loads = _row_count(all_loads)
+    if n_loads:
+        loads_file = written['fuel_loads'].result()
         print(f"✓ LOADS: {loads_file}")
-        print(f"  {len(df_loads)} records | {df_loads['Date'].min()} to {df_loads['Date'].max()}")
+        print(f"  {n_loads} records | {min(all_loads['Date'])} to {max(all_loads['Date'])}")
     
     # 3. TANK SIZES
-    df_tank_sizes = pd.DataFrame(all_tank_sizes)
-    if not df_tank_sizes.empty:
-        df_tank_sizes = df_tank_sizes.sort_values(['City', 'Site', 'Product', 'Tank_Number'])
-        tank_sizes_file = os.path.join(output_dir, 'tank_sizes.csv')
-        df_tank_sizes.to_csv(tank_sizes_file, index=False)
+    n_tank_sizes = _row_count(all_tank_sizes)
+    if n_tank_sizes:
+        tank_sizes_file = written['tank_sizes'].result()
         print(f"✓ TANK SIZES: {tank_sizes_file}")
-        print(f"  {len(df_tank_sizes)} records")
+        print(f"  {n_tank_sizes} records")
     
     # 4. INV SETTINGS
-    df_inv_settings = pd.DataFrame(all_inv_settings)
-    if not df_inv_settings.empty:
-        df_inv_settings = df_inv_settings.sort_values(['City', 'Site', 'Product', 'Tank_Number'])
-        inv_settings_file = os.path.join(output_dir, 'inv_settings.csv')
-        df_inv_settings.to_csv(inv_settings_file, index=False)
+    n_inv_settings = _row_count(all_inv_settings)
+    if n_inv_settings:
+        inv_settings_file = written['inv_settings'].result()
         print(f"✓ INV SETTINGS: {inv_settings_file}")
-        print(f"  {len(df_inv_settings)} records")
+        print(f"  {n_inv_settings} records")
     
     # # 5. SALES ACTUAL
     # df_sales_actual = pd.DataFrame(all_sales_actual)
@@ -1066,48 +1025,41 @@ def main():
     #     print(f"  {len(df_sales_actual)} records | {df_sales_actual['Date'].min()} to {df_sales_actual['Date'].max()}")
     
     # 6. SALES 3-WEEK AVG
-    df_three_week_avg = pd.DataFrame(all_three_week_avg)
-    if not df_three_week_avg.empty:
-<<<<<<< HEAD
-        df_three_week_avg = df_three_week_avg.sort_values(['Date', 'City', 'Site', 'Product'])
-=======
-        df_three_week_avg = df_three_week_avg.sort_values(['Date', 'Site', 'Product'])
->>>>>>> 87e965b46c39f97ad5410632916b1d336604ff04
-        three_week_avg_file = os.path.join(output_dir, 'three_week_avg.csv')
-        df_three_week_avg.to_csv(three_week_avg_file, index=False)
+    n_three_week_avg = _row_count(all_three_week_avg)
+    if n_three_week_avg:
+        three_week_avg_file = written['three_week_avg'].result()
         print(f"✓ 3-WEEK AVERAGE: {three_week_avg_file}")
-        print(f"  {len(df_three_week_avg)} records | {df_three_week_avg['Date'].min()} to {df_three_week_avg['Date'].max()}")
+        print(f"  {n_three_week_avg} records | {min(all_three_week_avg['Date'])} to {max(all_three_week_avg['Date'])}")
     
     # 7. SALES 2-MONTH AVG
-    df_2_month_avg = pd.DataFrame(all_2_month_avg)
-    if not df_2_month_avg.empty:
-<<<<<<< HEAD
-        df_2_month_avg = df_2_month_avg.sort_values(['Date', 'City', 'Site', 'Product'])
-=======
-        df_2_month_avg = df_2_month_avg.sort_values(['Date', 'Site', 'Product'])
->>>>>>> 87e965b46c39f97ad5410632916b1d336604ff04
-        two_month_avg_file = os.path.join(output_dir, 'two_month_avg.csv')
-        df_2_month_avg.to_csv(two_month_avg_file, index=False)
+    n_2_month_avg = _row_count(all_2_month_avg)
+    if n_2_month_avg:
+        two_month_avg_file = written['two_month_avg'].result()
         print(f"✓ 2-MONTH AVERAGE: {two_month_avg_file}")
-        print(f"  {len(df_2_month_avg)} records | {df_2_month_avg['Date'].min()} to {df_2_month_avg['Date'].max()}")
+        print(f"  {n_2_month_avg} records | {min(all_2_month_avg['Date'])} to {max(all_2_month_avg['Date'])}")
 
     # Summary
     print(f"\n{'='*80}")
     print("✅ EXTRACTION COMPLETE!")
     print('='*80)
     print(f"Cities processed: LA and RENO")
-    print(f"Total readings: {len(df_readings):,}")
-    print(f"Total loads: {len(df_loads):,}")
-    print(f"Total tank sizes: {len(df_tank_sizes)}")
-    print(f"Total inv settings: {len(df_inv_settings)}")
+    if skipped_sites:
+        print(f"Sites skipped (no data sections): {skipped_sites}")
+    print(f"Total readings: {n_readings:,}")
+    print(f"Total loads: {n_loads:,}")
+    print(f"Total tank sizes: {n_tank_sizes}")
+    print(f"Total inv settings: {n_inv_settings}")
     # print(f"Total sales actual: {len(df_sales_actual):,}")
-    print(f"Total 3-week averages: {len(df_three_week_avg):,}")
-    print(f"Total 2-month averages: {len(df_2_month_avg):,}")
+    print(f"Total 3-week averages: {n_three_week_avg:,}")
+    print(f"Total 2-month averages: {n_2_month_avg:,}")
     print(f"\nAll files saved to: {os.path.abspath(output_dir)}")
     print("\n🎯 Data is now in long format (tidy) and ready for analysis!")
 
 
 if __name__ == "__main__":
+    # In a frozen (PyInstaller) build, spawned site workers re-run this entry point; freeze_support()
+    # turns them into workers instead of starting another extraction. A no-op when not frozen
+    multiprocessing.freeze_support()
     try:
         main()
     except KeyboardInterrupt:
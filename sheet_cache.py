@@ -0,0 +1,150 @@
+"""
+Sheet Cache Module
+Fetches a published Google Sheet and keeps the parsed sheet as an Arrow IPC (Feather) snapshot
+that every extraction script shares
+"""
+
+import hashlib
+import os
+import tempfile
+import time
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.feather as feather
+import requests
+
+# Feather snapshots of fetched sheets, one per sheet URL
+CACHE_DIR = ".cache"
+
+# A snapshot younger than this (seconds) is used as is; an older one only while the server still
+# reports the same ETag/Last-Modified
+CACHE_MAX_AGE = 300
+
+# Schema metadata key holding the version the snapshot was fetched at
+_VALIDATOR_KEY = b'sheet_validator'
+
+
+def _sheet_validator(headers):
+    """ETag (or Last-Modified) identifying a sheet's version, None when the server sends neither"""
+    return headers.get('ETag') or headers.get('Last-Modified')
+
+
+def _snapshot_path(sheet_url):
+    """Snapshot file for a sheet"""
+    key = hashlib.sha256(sheet_url.encode()).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, f"sheet_{key}.feather")
+
+
+def _snapshot_is_current(sheet_url, path, max_age, session):
+    """Whether the snapshot at path can be used: recent enough, or still the sheet's current version"""
+    try:
+        if time.time() - os.path.getmtime(path) < max_age:
+            return True
+        
+        with pa.memory_map(path) as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+    except (pa.ArrowInvalid, OSError):
+        return False  # Missing or damaged snapshot: a cache miss, downloaded (and rewritten) again
+    validator = metadata.get(_VALIDATOR_KEY)
+    if not validator:
+        return False
+    
+    try:
+        head = session.head(sheet_url, timeout=30, allow_redirects=True)
+    except requests.exceptions.RequestException:
+        return False
+    if head.status_code != 200 or _sheet_validator(head.headers) != validator.decode():
+        return False
+    
+    os.utime(path)  # Unchanged: good for another max_age seconds without asking again
+    return True
+
+
+def parse_sheet(content):
+    """Parse a sheet's CSV bytes into an Arrow table (columns named "0".."n-1", types inferred per column)"""
+    # pyarrow's multithreaded parser reads the raw body directly, no decoded str copy.
+    # Empty cells are null in every column, as pandas reads them
+    table = pa_csv.read_csv(pa.py_buffer(content),
+                            read_options=pa_csv.ReadOptions(autogenerate_column_names=True),
+                            convert_options=pa_csv.ConvertOptions(strings_can_be_null=True))
+    return table.rename_columns([str(i) for i in range(table.num_columns)])
+
+
+def _sheet_frame(table, columns, nrows):
+    """The requested columns and leading rows of a sheet table as a DataFrame labelled by column position"""
+    if columns is not None:
+        table = table.select([str(col) for col in columns])
+    if nrows is not None:
+        table = table.slice(0, nrows)
+    # Only what was asked for is converted to pandas
+    df = table.to_pandas()
+    df.columns = df.columns.astype(int)
+    return df
+
+
+def fetch_sheet(sheet_url, max_age=CACHE_MAX_AGE, columns=None, nrows=None, use_cache=True, get=None,
+                session=requests):
+    """
+    Get a published sheet as a DataFrame, downloading it only when the snapshot is out of date
+    
+    Args:
+        sheet_url: Published CSV URL of the sheet
+        max_age: Seconds a snapshot is used without checking the sheet's version (default: 300)
+        columns: Column positions to return (default: None = all columns)
+        nrows: Number of leading rows to return (default: None = all rows)
+        use_cache: Read and write the snapshot (default: True)
+        get: Function downloading sheet_url and returning the successful response, reporting its own
+             progress (default: one requests GET, raising on an HTTP error)
+        session: requests session (or module) for the version check
+    
+    Returns:
+        DataFrame of the sheet as parsed by parse_sheet, column labels 0..n-1
+    """
+    path = _snapshot_path(sheet_url)
+    
+    if use_cache and os.path.exists(path) and _snapshot_is_current(sheet_url, path, max_age, session):
+        print("Sheet unchanged, loading from cache...")
+        try:
+            # The snapshot is uncompressed, so memory-mapping reads the requested columns in place
+            names = None if columns is None else [str(col) for col in columns]
+            return _sheet_frame(feather.read_table(path, columns=names, memory_map=True), None, nrows)
+        except (pa.ArrowInvalid, OSError) as e:
+            # A damaged snapshot is a cache miss: download the sheet and replace it
+            print(f"Cached sheet unreadable ({e}), downloading it again...")
+    
+    if get is None:
+        print("Fetching data from Google Sheets...")
+        response = session.get(sheet_url, timeout=30)
+        # Never parse (or snapshot) an error page
+        response.raise_for_status()
+    else:
+        response = get(sheet_url)
+    # The whole sheet is parsed, since the snapshot serves every script; only the requested
+    # columns and rows are then converted to pandas
+    table = parse_sheet(response.content)
+    
+    if use_cache:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            # The version goes in the schema metadata
+            validator = _sheet_validator(response.headers)
+            snapshot = table
+            if validator:
+                snapshot = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                                          _VALIDATOR_KEY: validator.encode()})
+            # Written to a temp file and renamed into place, so an interrupted write or another script
+            # caching the same sheet never leaves a truncated snapshot behind
+            fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+            os.close(fd)
+            try:
+                # Uncompressed, so a later memory-mapped read is zero-copy instead of decompressing
+                feather.write_feather(snapshot, tmp_path, compression='uncompressed')
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        except Exception as e:
+            print(f"Could not cache sheet: {e}")
+    
+    return _sheet_frame(table, columns, nrows)
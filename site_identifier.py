@@ -5,8 +5,16 @@ and getting the site name from the row directly above
 """
 
 import pandas as pd
+import numpy as np
 import re
 
+# clean_site_name patterns: leading numbers and single letters, trailing special characters
+_PREFIX_RE = re.compile(r'^[\d\s]+[a-z]?\s+', re.IGNORECASE)
+_SUFFIX_RE = re.compile(r'[\s\|\-]+$')
+
+# get_site_info section labels, one named group per info flag
+_SECTION_LABEL_RE = re.compile(r'(?P<has_readings>READINGS)|(?P<has_tank_sizes>TANK SIZE)|(?P<has_inv_settings>INV\.? SETTING)')
+
 
 def identify_sites(df, max_rows_to_scan=None):
     """
@@ -27,28 +35,31 @@ def identify_sites(df, max_rows_to_scan=None):
     
     sites = []
     rows_to_scan = len(df) if max_rows_to_scan is None else min(max_rows_to_scan, len(df))
+    col1 = df.iloc[:rows_to_scan, 1].to_numpy(dtype=object)
     
-    for idx in range(1, rows_to_scan):  # Start at 1 to ensure we can look back
-        # Check column 1 for "INV. SETTING"
-        cell_value = str(df.iloc[idx, 1]).strip() if pd.notna(df.iloc[idx, 1]) else ""
-        
-        if not cell_value:
+    # Cheap case-insensitive pre-filter: only the few cells mentioning "inv" are upper-cased and matched
+    # against "INV. SETTING" / "INV SETTING"; object dtype keeps Python's str.upper semantics
+    # (missing cells become 'nan', which never matches)
+    labels = pd.Series(col1.astype(str), dtype=object)
+    candidates = np.flatnonzero(labels.str.contains('inv', case=False, regex=False, na=False).to_numpy(dtype=bool))
+    is_inv_setting = labels.iloc[candidates].str.upper().str.contains(r'INV\.? SETTING', regex=True, na=False).to_numpy(dtype=bool)
+    
+    for idx in candidates[is_inv_setting].tolist():
+        if idx < 1:  # Start at 1 to ensure we can look back
             continue
         
-        # Check if this cell contains "INV. SETTING" or "INV SETTING"
-        if "INV. SETTING" in cell_value.upper() or "INV SETTING" in cell_value.upper():
-            # Get the site name from the row directly above
-            site_row = idx - 1
-            site_name_raw = str(df.iloc[site_row, 1]).strip() if pd.notna(df.iloc[site_row, 1]) else ""
+        # Get the site name from the row directly above
+        site_row = idx - 1
+        site_name_raw = str(col1[site_row]).strip() if pd.notna(col1[site_row]) else ""
+        
+        if site_name_raw:
+            # Clean up the site name
+            site_name = clean_site_name(site_name_raw)
             
-            if site_name_raw:
-                # Clean up the site name
-                site_name = clean_site_name(site_name_raw)
-                
-                # Avoid duplicates
-                if not any(site[1] == site_name for site in sites):
-                    sites.append((site_row, site_name))
-                    print(f"  ✓ Row {site_row}: {site_name}")
+            # Avoid duplicates
+            if not any(site[1] == site_name for site in sites):
+                sites.append((site_row, site_name))
+                print(f"  ✓ Row {site_row}: {site_name}")
     
     if not sites:
         print("  ⚠️  No sites found!")
@@ -72,10 +83,10 @@ def clean_site_name(raw_name):
     name = raw_name.strip()
     
     # Remove leading numbers and single letters (e.g., "1a OLD Morongo" -> "OLD Morongo")
-    name = re.sub(r'^[\d\s]+[a-z]?\s+', '', name, flags=re.IGNORECASE)
+    name = _PREFIX_RE.sub('', name)
     
     # Remove trailing special characters
-    name = re.sub(r'[\s\|\-]+$', '', name)
+    name = _SUFFIX_RE.sub('', name)
     
     # Clean up extra whitespace
     name = ' '.join(name.split())
@@ -94,30 +105,27 @@ def get_site_info(df, site_row):
     Returns:
         dict: Site information including validation flags
     """
+    name_cell = df.iloc[site_row, 1]
     info = {
         'row': site_row,
-        'name': clean_site_name(str(df.iloc[site_row, 1]).strip()) if pd.notna(df.iloc[site_row, 1]) else "Unknown",
+        'name': clean_site_name(str(name_cell).strip()) if pd.notna(name_cell) else "Unknown",
         'has_readings': False,
         'has_tank_sizes': False,
         'has_inv_settings': False
     }
     
-    # Check for data sections within next 40 rows
-    for offset in range(40):
-        row_idx = site_row + offset
-        if row_idx >= len(df):
-            break
-        
+    # Check for data sections within next 40 rows, read as one ndarray block instead of per-cell .iloc lookups
+    section_labels = df.iloc[site_row:site_row + 40, [1, 3]].to_numpy(dtype=object)
+    
+    for row_labels in section_labels:
         # Check both column 1 and column 3 for section labels
-        for col in [1, 3]:
-            cell = str(df.iloc[row_idx, col]).strip().upper() if pd.notna(df.iloc[row_idx, col]) else ""
+        for cell_value in row_labels:
+            cell = str(cell_value).strip().upper() if pd.notna(cell_value) else ""
             
-            if 'READINGS' in cell and 'AM READING' not in cell:
-                info['has_readings'] = True
-            if 'TANK SIZE' in cell:
-                info['has_tank_sizes'] = True
-            if 'INV. SETTING' in cell or 'INV SETTING' in cell:
-                info['has_inv_settings'] = True
+            # One regex pass finds every section label in the cell
+            for match in _SECTION_LABEL_RE.finditer(cell):
+                if match.lastgroup != 'has_readings' or 'AM READING' not in cell:
+                    info[match.lastgroup] = True
     
     return info
 
@@ -172,16 +180,13 @@ def print_site_report(sites_info):
 
 if __name__ == "__main__":
     # Test the module
-    import requests
-    from io import StringIO
+    from sheet_cache import fetch_sheet
     
     GOOGLE_SHEET_URL = "https://docs.google.com/spreadsheets/d/e/2PACX-1vRpva-TXUaQR_6tJoXX2vnSN2ertC5GNxAgssqmXvIhqHBNrscDxSxtiSWbCiiHqAoSHb3SzXDQw_VX/pub?gid=1048590026&single=true&output=csv"
     
     print("SITE IDENTIFICATION MODULE - TEST")
     print("="*80)
-    print("Fetching test data...")
-    response = requests.get(GOOGLE_SHEET_URL, timeout=30)
-    df = pd.read_csv(StringIO(response.text), header=None, low_memory=False)
+    df = fetch_sheet(GOOGLE_SHEET_URL)
     print(f"✓ Data shape: {df.shape}\n")
     
     # Identify sites
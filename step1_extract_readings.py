@@ -4,14 +4,19 @@ Extract readings for multiple sites across all tanks
 """
 
 import pandas as pd
-import requests
-from io import StringIO
+import numpy as np
 from datetime import datetime
+from functools import lru_cache
+import re
+from sheet_cache import fetch_sheet
 
 # Configuration
 GOOGLE_SHEET_URL = ""
 OUTPUT_FILE = "Step1_Sept2025_Readings.xlsx"
 
+# Labels of the sections that follow READINGS
+_SECTION_END_RE = re.compile(r'ULLAGE|LOADS|CARRIER|NOTES')
+
 # Site definitions: (row_index, site_name)
 SITES = [
     (4, 'OLD Morongo'),
@@ -22,11 +27,10 @@ SITES = [
 ]
 
 
+@lru_cache(maxsize=1)
 def fetch_data():
-    """Fetch Google Sheets data"""
-    print("Fetching data from Google Sheets...")
-    response = requests.get(GOOGLE_SHEET_URL)
-    df = pd.read_csv(StringIO(response.text), header=None, low_memory=False)
+    """Fetch Google Sheets data (through the shared sheet snapshot, see sheet_cache)"""
+    df = fetch_sheet(GOOGLE_SHEET_URL)
     print(f"Data shape: {df.shape}")
     return df
 
@@ -34,23 +38,26 @@ def fetch_data():
 def find_september_columns(df):
     """Find column indices for September 2025"""
     print("\nFinding September 2025 columns...")
-    dates_row = df.iloc[0, 6:]
-    
-    sept_data = []
-    for col_idx, date_val in enumerate(dates_row, start=6):
-        if pd.notna(date_val):
-            try:
-                parsed = pd.to_datetime(str(date_val), format='%b-%d-%y', errors='coerce')
-                if parsed and parsed.year == 2025 and parsed.month == 9:
-                    sept_data.append((col_idx, parsed))
-            except:
-                pass
+    dates_row = df.iloc[0, 6:].to_numpy(dtype=object)
+    
+    # Parse the whole header row in one call; blanks and non-date labels become NaT and never match
+    parsed = pd.to_datetime(dates_row.astype(str), format='%b-%d-%y', errors='coerce')
+    keep = np.flatnonzero((parsed.year == 2025) & (parsed.month == 9))
+    sept_data = list(zip((keep + 6).tolist(), parsed[keep]))
     
     print(f"Found {len(sept_data)} days in September 2025")
     print(f"Date range: {sept_data[0][1].date()} to {sept_data[-1][1].date()}")
     return sept_data
 
 
+def _to_float(text):
+    """float(text), NaN if the text is not a number"""
+    try:
+        return float(text)
+    except ValueError:
+        return np.nan
+
+
 def extract_site_readings(df, site_row, site_name, date_columns):
     """Extract readings for a single site"""
     print(f"\n{'='*60}")
@@ -60,6 +67,10 @@ def extract_site_readings(df, site_row, site_name, date_columns):
     # Find the READINGS section by looking for "READINGS" label in column 3
     # Then collect product rows that follow until we hit another section
     
+    # Label/value columns as plain ndarrays, indexed directly instead of per-cell .iloc lookups
+    col3 = df.iloc[:, 3].to_numpy(dtype=object)
+    col4 = df.iloc[:, 4].to_numpy(dtype=object)
+    
     reading_start_row = None
     reading_end_row = None
     
@@ -69,7 +80,7 @@ def extract_site_readings(df, site_row, site_name, date_columns):
         if row_idx >= len(df):
             break
         
-        section_label = str(df.iloc[row_idx, 3]).strip() if pd.notna(df.iloc[row_idx, 3]) else ""
+        section_label = str(col3[row_idx]).strip() if pd.notna(col3[row_idx]) else ""
         
         if "READINGS" in section_label.upper():
             reading_start_row = row_idx + 1  # Data starts next row
@@ -78,7 +89,7 @@ def extract_site_readings(df, site_row, site_name, date_columns):
     
     if reading_start_row is None:
         print(f"  WARNING: Could not find READINGS section for {site_name}")
-        return []
+        return {}
     
     # Now find where READINGS section ends (next section like ULLAGE, LOADS, etc.)
     for offset in range(15):
@@ -86,9 +97,9 @@ def extract_site_readings(df, site_row, site_name, date_columns):
         if row_idx >= len(df):
             break
         
-        section_label = str(df.iloc[row_idx, 3]).strip() if pd.notna(df.iloc[row_idx, 3]) else ""
+        section_label = str(col3[row_idx]).strip() if pd.notna(col3[row_idx]) else ""
         
-        if any(keyword in section_label.upper() for keyword in ['ULLAGE', 'LOADS', 'CARRIER', 'NOTES']):
+        if _SECTION_END_RE.search(section_label.upper()):
             reading_end_row = row_idx
             print(f"  READINGS section ends at row {row_idx} (next section: {section_label})")
             break
@@ -97,7 +108,6 @@ def extract_site_readings(df, site_row, site_name, date_columns):
         reading_end_row = reading_start_row + 10  # Default to 10 rows
     
     # Scan the READINGS section to find all product entries
-    records = []
     products_found = {}
     
     for row_idx in range(reading_start_row, reading_end_row):
@@ -105,7 +115,7 @@ def extract_site_readings(df, site_row, site_name, date_columns):
             break
         
         # Product is in column 4
-        product_cell = df.iloc[row_idx, 4]
+        product_cell = col4[row_idx]
         
         if pd.notna(product_cell):
             product = str(product_cell).strip()
@@ -119,34 +129,50 @@ def extract_site_readings(df, site_row, site_name, date_columns):
                 products_found[product].append(row_idx)
                 print(f"  Found {product} at row {row_idx}")
     
-    # Now extract readings for each date
-    for col_idx, date in date_columns:
-        for product, row_indices in products_found.items():
-            # Create a record with multiple tank readings
-            record = {
-                'Date': date.strftime('%Y-%m-%d'),
-                'Site': site_name,
-                'Product': product
-            }
-            
-            # Extract values for each tank (each row is a different tank)
-            for tank_num, row_idx in enumerate(row_indices, start=1):
-                value = df.iloc[row_idx, col_idx]
-                
-                # Clean the value
-                if pd.notna(value):
-                    try:
-                        clean_val = str(value).replace(',', '').strip()
-                        numeric_val = float(clean_val) if clean_val else None
-                        record[f'Tank_{tank_num}_Reading'] = numeric_val
-                    except:
-                        record[f'Tank_{tank_num}_Reading'] = None
-                else:
-                    record[f'Tank_{tank_num}_Reading'] = None
-            
-            records.append(record)
-    
-    print(f"  Extracted {len(records)} records for {site_name}")
+    if not products_found or not date_columns:
+        print(f"  Extracted 0 records for {site_name}")
+        return {}
+    
+    # Slice every tank row across all date columns at once and clean/convert the whole block
+    tank_rows = [row_idx for row_indices in products_found.values() for row_idx in row_indices]
+    date_cols = [col_idx for col_idx, _ in date_columns]
+    block = df.iloc[tank_rows, date_cols].to_numpy(dtype=object)
+    present = pd.notna(block)
+    texts = np.char.strip(np.char.replace(np.where(present, block, '').astype(str), ',', ''))
+    present &= texts != ''
+    try:
+        # Whole-block cast, the common case when every filled cell is a number
+        numeric = np.where(present, texts, 'nan').astype(np.float64)
+    except ValueError:
+        numeric = np.array([_to_float(text) for text in np.where(present, texts, 'nan').ravel()]).reshape(block.shape)
+    readings = np.where(present & ~np.isnan(numeric), numeric, None).tolist()
+    
+    # Split the block's rows back into each product's tanks
+    tank_readings = {}
+    for product, row_indices in products_found.items():
+        tank_readings[product] = readings[:len(row_indices)]
+        readings = readings[len(row_indices):]
+    
+    # Now extract readings for each date - one list per output column, one row per (date, product)
+    n_records = len(date_columns) * len(products_found)
+    # Format the dates once, vectorized, rather than once per record
+    date_strs = pd.DatetimeIndex([date for _, date in date_columns]).strftime('%Y-%m-%d').tolist()
+    records = {
+        'Date': [date_str for date_str in date_strs for _ in products_found],
+        'Site': [site_name] * n_records,
+        'Product': list(products_found) * len(date_columns)
+    }
+    
+    # Each row is a different tank; products with fewer tanks get None for the extra tank columns
+    n_tanks = max(len(row_indices) for row_indices in products_found.values())
+    for tank_idx in range(n_tanks):
+        records[f'Tank_{tank_idx + 1}_Reading'] = [
+            tank_readings[product][tank_idx][date_pos] if tank_idx < len(tank_readings[product]) else None
+            for date_pos in range(len(date_columns))
+            for product in products_found
+        ]
+    
+    print(f"  Extracted {n_records} records for {site_name}")
     return records
 
 
@@ -163,16 +189,16 @@ def main():
     sept_cols = find_september_columns(df)
     
     # Step 3: Extract readings for each site
-    all_records = []
-    
-    for site_row, site_name in SITES:
-        records = extract_site_readings(df, site_row, site_name, sept_cols)
-        all_records.extend(records)
+    site_records = [extract_site_readings(df, site_row, site_name, sept_cols) for site_row, site_name in SITES]
     
-    # Step 4: Convert to DataFrame
+    # Step 4: Convert to DataFrame - one frame per site's columns; concat fills the tank columns a site lacks
     print(f"\n{'='*80}")
     print(f"Creating final dataset...")
-    df_output = pd.DataFrame(all_records)
+    site_frames = [
+        pd.DataFrame(records).astype({name: 'float64' for name in records if name.startswith('Tank_')})
+        for records in site_records if records
+    ]
+    df_output = pd.concat(site_frames, ignore_index=True) if site_frames else pd.DataFrame()
     
     # Get all tank columns and sort them
     tank_cols = [col for col in df_output.columns if col.startswith('Tank_')]
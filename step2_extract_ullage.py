@@ -4,9 +4,10 @@ Extract ullage (empty space) readings for multiple sites across all tanks
 """
 
 import pandas as pd
-import requests
-from io import StringIO
+import numpy as np
 from datetime import datetime
+from functools import lru_cache
+from sheet_cache import fetch_sheet
 
 # Configuration
 GOOGLE_SHEET_URL = ""
@@ -22,11 +23,10 @@ SITES = [
 ]
 
 
+@lru_cache(maxsize=1)
 def fetch_data():
-    """Fetch Google Sheets data"""
-    print("Fetching data from Google Sheets...")
-    response = requests.get(GOOGLE_SHEET_URL)
-    df = pd.read_csv(StringIO(response.text), header=None, low_memory=False)
+    """Fetch Google Sheets data (through the shared sheet snapshot, see sheet_cache)"""
+    df = fetch_sheet(GOOGLE_SHEET_URL)
     print(f"Data shape: {df.shape}")
     return df
 
@@ -34,23 +34,26 @@ def fetch_data():
 def find_september_columns(df):
     """Find column indices for September 2025"""
     print("\nFinding September 2025 columns...")
-    dates_row = df.iloc[0, 6:]
-    
-    sept_data = []
-    for col_idx, date_val in enumerate(dates_row, start=6):
-        if pd.notna(date_val):
-            try:
-                parsed = pd.to_datetime(str(date_val), format='%b-%d-%y', errors='coerce')
-                if parsed and parsed.year == 2025 and parsed.month == 9:
-                    sept_data.append((col_idx, parsed))
-            except:
-                pass
+    dates_row = df.iloc[0, 6:].to_numpy(dtype=object)
+    
+    # Parse the whole header row in one call; blanks and non-date labels become NaT and never match
+    parsed = pd.to_datetime(dates_row.astype(str), format='%b-%d-%y', errors='coerce')
+    keep = np.flatnonzero((parsed.year == 2025) & (parsed.month == 9))
+    sept_data = list(zip((keep + 6).tolist(), parsed[keep]))
     
     print(f"Found {len(sept_data)} days in September 2025")
     print(f"Date range: {sept_data[0][1].date()} to {sept_data[-1][1].date()}")
     return sept_data
 
 
+def _to_float(text):
+    """float(text), None if the text is not a number"""
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
 def extract_site_ullage(df, site_row, site_name, date_columns):
     """Extract ullage readings for a single site"""
     print(f"\n{'='*60}")
@@ -119,30 +122,50 @@ def extract_site_ullage(df, site_row, site_name, date_columns):
                 products_found[product].append(row_idx)
                 print(f"  Found {product} at row {row_idx}")
     
-    # Now extract ullage values for each date
-    for col_idx, date in date_columns:
-        for product, row_indices in products_found.items():
+    if not products_found or not date_columns:
+        print(f"  Extracted 0 ullage records for {site_name}")
+        return []
+    
+    # Slice every tank row across all date columns at once and clean/convert the whole block
+    tank_rows = [row_idx for row_indices in products_found.values() for row_idx in row_indices]
+    block = df.iloc[tank_rows, [col_idx for col_idx, _ in date_columns]].to_numpy(dtype=object)
+    present = pd.notna(block)
+    texts = np.char.strip(np.char.replace(np.where(present, block, '').astype(str), ',', ''))
+    present &= texts != ''
+    texts = np.where(present, texts, 'nan')
+    try:
+        # Whole-block cast, the common case when every filled cell is a number
+        numeric = texts.astype(np.float64)
+    except ValueError:
+        numeric = np.array([_to_float(text) for text in texts.ravel()], dtype=object).reshape(block.shape)
+        present &= np.not_equal(numeric, None)
+    ullage = np.where(present, numeric, None).tolist()
+    
+    # Split the block's rows back into each product's tanks
+    tank_ullage = {}
+    for product, row_indices in products_found.items():
+        tank_ullage[product] = ullage[:len(row_indices)]
+        ullage = ullage[len(row_indices):]
+    
+    # Format the dates once, vectorized, rather than once per record
+    date_strs = pd.DatetimeIndex([date for _, date in date_columns]).strftime('%Y-%m-%d').tolist()
+    
+    # Tank column names depend only on the tank count, so build them once rather than per record
+    tank_columns = [f'Tank_{tank_num}_Ullage' for tank_num in range(1, max(map(len, products_found.values())) + 1)]
+    
+    # Now build one record per (date, product)
+    for date_pos, date_str in enumerate(date_strs):
+        for product, tanks in tank_ullage.items():
             # Create a record with multiple tank ullage readings
             record = {
-                'Date': date.strftime('%Y-%m-%d'),
+                'Date': date_str,
                 'Site': site_name,
                 'Product': product
             }
             
-            # Extract values for each tank (each row is a different tank)
-            for tank_num, row_idx in enumerate(row_indices, start=1):
-                value = df.iloc[row_idx, col_idx]
-                
-                # Clean the value
-                if pd.notna(value):
-                    try:
-                        clean_val = str(value).replace(',', '').strip()
-                        numeric_val = float(clean_val) if clean_val else None
-                        record[f'Tank_{tank_num}_Ullage'] = numeric_val
-                    except:
-                        record[f'Tank_{tank_num}_Ullage'] = None
-                else:
-                    record[f'Tank_{tank_num}_Ullage'] = None
+            # Each row is a different tank
+            for tank_column, tank in zip(tank_columns, tanks):
+                record[tank_column] = tank[date_pos]
             
             records.append(record)
     
@@ -5,8 +5,9 @@ Tank Size - Reading = Ullage
 """
 
 import pandas as pd
-import requests
-from io import StringIO
+import numpy as np
+from functools import lru_cache
+from sheet_cache import fetch_sheet
 
 # Configuration
 GOOGLE_SHEET_URL = ""
@@ -22,15 +23,22 @@ SITES = [
 ]
 
 
+@lru_cache(maxsize=1)
 def fetch_data():
-    """Fetch Google Sheets data"""
-    print("Fetching data from Google Sheets...")
-    response = requests.get(GOOGLE_SHEET_URL)
-    df = pd.read_csv(StringIO(response.text), header=None, low_memory=False)
+    """Fetch Google Sheets data (through the shared sheet snapshot, see sheet_cache)"""
+    df = fetch_sheet(GOOGLE_SHEET_URL)
     print(f"Data shape: {df.shape}")
     return df
 
 
+def _to_float(text):
+    """float(text), None if the text is not a number"""
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
 def extract_site_tank_sizes(df, site_row, site_name):
     """Extract tank sizes for a single site"""
     print(f"\n{'='*60}")
@@ -43,6 +51,11 @@ def extract_site_tank_sizes(df, site_row, site_name):
     # 3. For each row, get tank size from column 1 and product from column 4
     # 4. Skip rows where product contains "total"
     
+    # Label/value columns as plain ndarrays, indexed directly instead of per-cell .iloc lookups
+    col1 = df.iloc[:, 1].to_numpy(dtype=object)
+    col3 = df.iloc[:, 3].to_numpy(dtype=object)
+    col4 = df.iloc[:, 4].to_numpy(dtype=object)
+    
     tank_size_row = None
     
     # Find TANK SIZE label in column 1
@@ -51,7 +64,7 @@ def extract_site_tank_sizes(df, site_row, site_name):
         if row_idx >= len(df):
             break
         
-        label = str(df.iloc[row_idx, 1]).strip() if pd.notna(df.iloc[row_idx, 1]) else ""
+        label = str(col1[row_idx]).strip() if pd.notna(col1[row_idx]) else ""
         
         if "TANK SIZE" in label.upper():
             tank_size_row = row_idx
@@ -60,29 +73,44 @@ def extract_site_tank_sizes(df, site_row, site_name):
     
     if tank_size_row is None:
         print(f"  WARNING: Could not find TANK SIZE label for {site_name}")
-        return []
+        return {}
     
     # Now extract all tank sizes from rows below until we hit SALES
-    records = []
+    tanks = []  # (Product, Tank_Number, Tank_Size) per tank row; Tank_Number 0 marks a total row
     products_found = {}
     
+    # Clean and convert the whole window of column 1 tank sizes at once
+    window = col1[tank_size_row + 1:tank_size_row + 20]
+    if not len(window):
+        print(f"  Extracted 0 tank size records for {site_name}")
+        return {}
+    present = pd.notna(window)
+    texts = np.char.strip(np.char.replace(np.where(present, window, '').astype(str), ',', ''))
+    present &= texts != ''
+    texts = np.where(present, texts, 'nan')
+    try:
+        # Whole-window cast, the common case when every filled cell is a number
+        sizes = np.where(present, texts.astype(np.float64), None).tolist()
+    except ValueError:
+        sizes = [_to_float(text) if filled else None for text, filled in zip(texts.tolist(), present.tolist())]
+    
     for row_idx in range(tank_size_row + 1, tank_size_row + 20):
         if row_idx >= len(df):
             break
         
         # Check if we've hit SALES section (end of tank size section)
-        col1_label = str(df.iloc[row_idx, 1]).strip() if pd.notna(df.iloc[row_idx, 1]) else ""
-        col3_label = str(df.iloc[row_idx, 3]).strip() if pd.notna(df.iloc[row_idx, 3]) else ""
+        col1_label = str(col1[row_idx]).strip() if pd.notna(col1[row_idx]) else ""
+        col3_label = str(col3[row_idx]).strip() if pd.notna(col3[row_idx]) else ""
         
         if "SALES" in col1_label.upper() or "SALES" in col3_label.upper():
             print(f"  Tank size section ends at row {row_idx} (SALES section found)")
             break
         
         # Get tank size from column 1 (column B)
-        tank_size = df.iloc[row_idx, 1]
+        tank_size = col1[row_idx]
         
         # Get product from column 4 (column E)
-        product_cell = df.iloc[row_idx, 4]
+        product_cell = col4[row_idx]
         
         # Only process if both tank size and product exist
         if pd.notna(tank_size) and pd.notna(product_cell):
@@ -97,47 +125,35 @@ def extract_site_tank_sizes(df, site_row, site_name):
             elif "dsl" in product.lower():
                 base_product = 'dsl'
             
-            if base_product:
-                try:
-                    clean_val = str(tank_size).replace(',', '').strip()
-                    size_val = float(clean_val) if clean_val else None
+            size_val = sizes[row_idx - tank_size_row - 1]
+            
+            if base_product and size_val and size_val > 0:
+                # Check if this is a "total" row
+                is_total = "total" in product.lower()
+                
+                # Track product occurrences for tank numbering
+                if base_product not in products_found:
+                    products_found[base_product] = []
+                
+                if is_total:
+                    # For total rows, use Tank_Number = 0 to indicate aggregate
+                    tanks.append((base_product, 0, size_val))  # Tank_Number 0 = Total/Aggregate
+                    print(f"  Found {base_product} TOTAL: {size_val:,.0f} (row {row_idx})")
+                else:
+                    # For individual tank rows
+                    tank_num = len(products_found[base_product]) + 1
+                    products_found[base_product].append(size_val)
                     
-                    if size_val and size_val > 0:
-                        # Check if this is a "total" row
-                        is_total = "total" in product.lower()
-                        
-                        # Track product occurrences for tank numbering
-                        if base_product not in products_found:
-                            products_found[base_product] = []
-                        
-                        if is_total:
-                            # For total rows, use Tank_Number = 0 to indicate aggregate
-                            records.append({
-                                'Site': site_name,
-                                'Product': base_product,
-                                'Tank_Number': 0,  # 0 = Total/Aggregate
-                                'Tank_Size': size_val,
-                                'Is_Total': True
-                            })
-                            print(f"  Found {base_product} TOTAL: {size_val:,.0f} (row {row_idx})")
-                        else:
-                            # For individual tank rows
-                            tank_num = len(products_found[base_product]) + 1
-                            products_found[base_product].append(size_val)
-                            
-                            records.append({
-                                'Site': site_name,
-                                'Product': base_product,
-                                'Tank_Number': tank_num,
-                                'Tank_Size': size_val,
-                                'Is_Total': False
-                            })
-                            print(f"  Found {base_product} Tank {tank_num}: {size_val:,.0f} (row {row_idx})")
-                except:
-                    pass
-    
-    print(f"  Extracted {len(records)} tank size records for {site_name}")
-    return records
+                    tanks.append((base_product, tank_num, size_val))
+                    print(f"  Found {base_product} Tank {tank_num}: {size_val:,.0f} (row {row_idx})")
+    
+    # One list per output column
+    records = {'Site': [site_name] * len(tanks)}
+    for name, values in zip(['Product', 'Tank_Number', 'Tank_Size'], zip(*tanks)):
+        records[name] = list(values)
+    
+    print(f"  Extracted {len(tanks)} tank size records for {site_name}")
+    return records if tanks else {}
 
 
 def main():
@@ -150,16 +166,16 @@ def main():
     df = fetch_data()
     
     # Step 2: Extract tank sizes for each site
-    all_records = []
-    
-    for site_row, site_name in SITES:
-        records = extract_site_tank_sizes(df, site_row, site_name)
-        all_records.extend(records)
+    site_records = [extract_site_tank_sizes(df, site_row, site_name) for site_row, site_name in SITES]
     
-    # Step 3: Convert to DataFrame
+    # Step 3: Convert to DataFrame - concatenate each column across sites, then build it once
     print(f"\n{'='*80}")
     print(f"Creating final dataset...")
-    df_output = pd.DataFrame(all_records)
+    site_records = [records for records in site_records if records]
+    df_output = pd.DataFrame({
+        name: [value for records in site_records for value in records[name]]
+        for name in ['Site', 'Product', 'Tank_Number', 'Tank_Size']
+    } if site_records else {})
     
     # Sort by Site, Product, Tank_Number
     df_output = df_output.sort_values(['Site', 'Product', 'Tank_Number'])
@@ -4,12 +4,25 @@ Extract the desired inventory levels for efficient operation at each site
 """
 
 import pandas as pd
-import requests
-from io import StringIO
+import numpy as np
+import importlib.util
+import os
+import pyarrow as pa
+import pyarrow.compute as pc
+from sheet_cache import fetch_sheet
 
 # Configuration
 GOOGLE_SHEET_URL = ""
-OUTPUT_FILE = "Step4_Inv_Settings.xlsx"
+OUTPUT_FILE = "Step4_Inv_Settings.xlsx"  # .xlsx, or .parquet to write a Parquet file instead
+VERBOSE = False  # Print every extracted setting, not just a count per site
+SHOW_TABLE = bool(os.environ.get("SHOW_TABLE"))  # Print the complete settings table (run with SHOW_TABLE=1)
+
+# Rows from a site header through the end of its INV. SETTING section (label within 20 rows,
+# section at most 19 rows below it); no row further down is read
+SITE_SPAN = 40
+
+# Base products, in sorted order
+BASE_PRODUCTS = ['87', '91', 'dsl']
 
 # Site definitions: (row_index, site_name)
 SITES = [
@@ -21,184 +34,255 @@ SITES = [
 ]
 
 
-def fetch_data():
-    """Fetch Google Sheets data"""
-    print("Fetching data from Google Sheets...")
-    response = requests.get(GOOGLE_SHEET_URL)
-    df = pd.read_csv(StringIO(response.text), header=None, low_memory=False)
+def fetch_data(nrows=None):
+    """Fetch Google Sheets data (through the shared sheet snapshot, see sheet_cache), the first nrows rows"""
+    # Only columns B (labels/levels) and E (products) are used: take just those, as the cell text
+    # (blank cells are ""). Column B is held as Arrow strings and column E, a handful of repeated
+    # product labels, as a categorical. The two columns are cut to nrows in Arrow, before any pandas
+    # conversion. The snapshot is reused only while the sheet's version is unchanged
+    df = fetch_sheet(GOOGLE_SHEET_URL, max_age=0, columns=[1, 4], nrows=nrows)
+    df = df.astype('string[pyarrow]').fillna('').astype({4: 'category'})
     print(f"Data shape: {df.shape}")
     return df
 
 
-def extract_site_inv_settings(df, site_row, site_name):
-    """Extract inventory settings for a single site"""
-    print(f"\n{'='*60}")
-    print(f"Extracting: {site_name} (starting at row {site_row})")
-    print('='*60)
+def find_section_labels(df):
+    """
+    Locate the section labels in column B with one vectorized pass over the sheet
+    
+    Returns:
+        dict of sorted row positions: 'inv_setting' (INV. SETTING / INV SETTING) and 'tank_size' (TANK SIZE)
+    """
+    # Arrow compute kernels scan the UTF-8 buffer directly; missing cells are null and never match
+    labels = pc.utf8_upper(pa.array(df.iloc[:, 0].astype('string[pyarrow]')))
+    return {
+        'inv_setting': np.flatnonzero(pc.match_substring_regex(labels, r'INV\.? SETTING').fill_null(False).to_numpy(zero_copy_only=False)),
+        'tank_size': np.flatnonzero(pc.match_substring(labels, 'TANK SIZE').fill_null(False).to_numpy(zero_copy_only=False))
+    }
+
+
+def _to_float(text):
+    """float(text), None if the text is not a number"""
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def extract_inv_settings(df, sites, section_labels=None, verbose=False):
+    """
+    Extract inventory settings for all sites in one vectorized pass over their sections
+    
+    Args:
+        df: Sheet data from fetch_data (column B, column E)
+        sites: List of (row_index, site_name) tuples
+        section_labels: Label positions from find_section_labels (located here if not given)
+        verbose: Print every section's label rows and settings instead of one line per site
     
+    Returns:
+        dict of output columns (Site, Product, Tank_Number, Desired_Level, Is_Total), one row per
+        setting, sorted by Site, Product and Tank_Number
+    """
     # Strategy:
     # 1. Find the row with "INV. SETTING" in column 1
     # 2. Extract all rows below it until we hit "TANK SIZE"
     # 3. For each row, get desired level from column 1 and product from column 4
     # 4. Skip rows where product contains "total"
     
-    inv_setting_row = None
+    if section_labels is None:
+        section_labels = find_section_labels(df)
     
-    # Find INV. SETTING label in column 1
-    for offset in range(20):
-        row_idx = site_row + offset
-        if row_idx >= len(df):
-            break
-        
-        label = str(df.iloc[row_idx, 1]).strip() if pd.notna(df.iloc[row_idx, 1]) else ""
-        
-        if "INV. SETTING" in label.upper() or "INV SETTING" in label.upper():
-            inv_setting_row = row_idx
-            print(f"  Found INV. SETTING label at row {row_idx}")
-            break
-    
-    if inv_setting_row is None:
-        print(f"  WARNING: Could not find INV. SETTING label for {site_name}")
-        return []
-    
-    # Now extract all inventory settings from rows below until we hit TANK SIZE
-    records = []
-    products_found = {}
-    
-    for row_idx in range(inv_setting_row + 1, inv_setting_row + 20):
-        if row_idx >= len(df):
-            break
+    # Binary-search every site's INV. SETTING label: the first one within 20 rows of the site header.
+    # A sentinel past the end stands in for "no label below this row"
+    site_rows = np.array([site_row for site_row, _ in sites], dtype=np.int64)
+    no_label = np.iinfo(np.int64).max
+    inv_labels = np.append(section_labels['inv_setting'], no_label)
+    inv_rows = inv_labels[np.searchsorted(inv_labels, site_rows)]
+    has_section = inv_rows < site_rows + 20
+    inv_rows = np.where(has_section, inv_rows, -1)
+    
+    # Each section runs from the row below its label until TANK SIZE (at most 19 rows)
+    tank_labels = np.append(section_labels['tank_size'], no_label)
+    tank_rows = tank_labels[np.searchsorted(tank_labels, inv_rows + 1)]
+    ends_at_tank_size = has_section & (tank_rows < inv_rows + 20)
+    end_rows = np.where(ends_at_tank_size, tank_rows, np.minimum(inv_rows + 20, len(df)))
+    end_rows = np.where(has_section, end_rows, inv_rows + 1)
+    
+    # Concatenate the sections' rows, tagging each with the index of its site
+    lengths = end_rows - (inv_rows + 1)
+    site_ids = np.repeat(np.arange(len(sites)), lengths)
+    rows = np.arange(lengths.sum()) + np.repeat(inv_rows + 1 - (np.cumsum(lengths) - lengths), lengths)
+    
+    # Desired levels from column 1 (column B); only the section rows are taken out of the frame
+    levels = df.iloc[rows, 0].to_numpy(dtype=object)
+    
+    # Products from column 4 (column E) repeat a handful of labels: strip each distinct label once
+    # (a trailing '' stands in for missing cells, code -1) and look the rows up by label code
+    label_codes, labels = pd.factorize(df.iloc[rows, 1])
+    labels = pa.array(np.char.strip(np.append(np.asarray(labels, dtype=object), '').astype(str)).tolist(), type=pa.string())
+    
+    # Extract base product (87, 91, dsl) for each distinct label - handle "87 total", etc. The first
+    # match wins ("87" anywhere, else "91" anywhere, else "dsl" in any case); the codes index
+    # BASE_PRODUCTS (-1 for any other label), so they order like the product names
+    matched = np.column_stack([
+        pc.match_substring(labels, product, ignore_case=True).to_numpy(zero_copy_only=False)
+        for product in BASE_PRODUCTS
+    ])
+    product_codes = np.where(matched.any(axis=1), matched.argmax(axis=1), -1)[label_codes]
+    base_products = np.array(BASE_PRODUCTS + [''])[product_codes]
+    is_totals = pc.match_substring(labels, 'total', ignore_case=True).to_numpy(zero_copy_only=False)[label_codes]
+    
+    # Only rows with both a desired level and a product, and a positive level, are settings.
+    # Clean and convert all the levels at once; blank or unparseable levels become NaN
+    has_level = (levels != "") & (base_products != '')
+    texts = np.where(has_level, levels, '').astype(str)
+    if len(texts):
+        texts = np.char.strip(np.char.replace(texts, ',', ''))
+    texts = np.where(has_level & (texts != ''), texts, 'nan')
+    try:
+        # Whole-array cast, the common case when every level is a number
+        level_vals = texts.astype(np.float64)
+    except ValueError:
+        level_vals = np.array([_to_float(text) for text in texts.tolist()], dtype=np.float64)
+    is_setting = level_vals > 0
+    
+    # Individual tanks are numbered 1, 2, ... per site and product in row order; total rows get
+    # Tank_Number = 0 to indicate aggregate
+    is_tank = is_setting & ~is_totals
+    tank_numbers = np.zeros(len(rows), dtype=np.int64)
+    tank_numbers[is_tank] = pd.DataFrame({
+        'site': site_ids[is_tank], 'product': base_products[is_tank]
+    }).groupby(['site', 'product'], sort=False).cumcount().to_numpy() + 1
+    
+    keep = np.flatnonzero(is_setting)
+    
+    # Report what was found: one summary line per site, and each section's rows only when verbose
+    site_records = np.searchsorted(site_ids[keep], np.arange(len(sites) + 1))
+    for site_id, (site_row, site_name) in enumerate(sites):
+        first, last = site_records[site_id], site_records[site_id + 1]
         
-        # Check if we've hit TANK SIZE section (end of inv settings section)
-        col1_label = str(df.iloc[row_idx, 1]).strip() if pd.notna(df.iloc[row_idx, 1]) else ""
+        if not verbose:
+            if has_section[site_id]:
+                print(f"  {site_name}: {last - first} INV. SETTING records")
+            else:
+                print(f"  WARNING: Could not find INV. SETTING label for {site_name}")
+            continue
         
-        if "TANK SIZE" in col1_label.upper():
-            print(f"  INV. SETTING section ends at row {row_idx} (TANK SIZE found)")
-            break
+        print(f"\n{'='*60}")
+        print(f"Extracting: {site_name} (starting at row {site_row})")
+        print('='*60)
         
-        # Get desired level from column 1 (column B)
-        desired_level = df.iloc[row_idx, 1]
+        if not has_section[site_id]:
+            print(f"  WARNING: Could not find INV. SETTING label for {site_name}")
+            continue
         
-        # Get product from column 4 (column E)
-        product_cell = df.iloc[row_idx, 4]
+        print(f"  Found INV. SETTING label at row {inv_rows[site_id]}")
+        if ends_at_tank_size[site_id]:
+            print(f"  INV. SETTING section ends at row {end_rows[site_id]} (TANK SIZE found)")
         
-        # Only process if both desired level and product exist
-        if pd.notna(desired_level) and pd.notna(product_cell):
-            product = str(product_cell).strip()
-            
-            # Extract base product (87, 91, dsl) - handle "87 total", etc.
-            base_product = None
-            if "87" in product:
-                base_product = '87'
-            elif "91" in product:
-                base_product = '91'
-            elif "dsl" in product.lower():
-                base_product = 'dsl'
-            
-            if base_product:
-                try:
-                    clean_val = str(desired_level).replace(',', '').strip()
-                    level_val = float(clean_val) if clean_val else None
-                    
-                    if level_val and level_val > 0:
-                        # Check if this is a "total" row
-                        is_total = "total" in product.lower()
-                        
-                        # Track product occurrences for tank numbering
-                        if base_product not in products_found:
-                            products_found[base_product] = []
-                        
-                        if is_total:
-                            # For total rows, use Tank_Number = 0 to indicate aggregate
-                            records.append({
-                                'Site': site_name,
-                                'Product': base_product,
-                                'Tank_Number': 0,  # 0 = Total/Aggregate
-                                'Desired_Level': level_val,
-                                'Is_Total': True
-                            })
-                            print(f"  Found {base_product} TOTAL: {level_val:,.0f} (row {row_idx})")
-                        else:
-                            # For individual tank rows
-                            tank_num = len(products_found[base_product]) + 1
-                            products_found[base_product].append(level_val)
-                            
-                            records.append({
-                                'Site': site_name,
-                                'Product': base_product,
-                                'Tank_Number': tank_num,
-                                'Desired_Level': level_val,
-                                'Is_Total': False
-                            })
-                            print(f"  Found {base_product} Tank {tank_num}: {level_val:,.0f} (row {row_idx})")
-                except:
-                    pass
-    
-    print(f"  Extracted {len(records)} INV. SETTING records for {site_name}")
-    return records
+        site_keep = keep[first:last]
+        for base_product, tank_num, level_val, row_idx in zip(
+            base_products[site_keep].tolist(), tank_numbers[site_keep].tolist(),
+            level_vals[site_keep].tolist(), rows[site_keep].tolist()
+        ):
+            if tank_num == 0:
+                print(f"  Found {base_product} TOTAL: {level_val:,.0f} (row {row_idx})")
+            else:
+                print(f"  Found {base_product} Tank {tank_num}: {level_val:,.0f} (row {row_idx})")
+        print(f"  Extracted {last - first} INV. SETTING records for {site_name}")
+    
+    # Emit the settings already ordered by Site, Product and Tank_Number (totals, tank 0, first): one
+    # stable integer lexsort over site-name ranks and product codes instead of a sort on the strings
+    site_names = np.array([site_name for _, site_name in sites], dtype=object)
+    _, site_ranks = np.unique(site_names, return_inverse=True)
+    keep = keep[np.lexsort((tank_numbers[keep], product_codes[keep], site_ranks[site_ids[keep]]))]
+    
+    # One array per output column
+    return {
+        'Site': site_names[site_ids[keep]].tolist(),
+        'Product': base_products[keep].tolist(),
+        'Tank_Number': tank_numbers[keep],  # 0 = Total/Aggregate
+        'Desired_Level': level_vals[keep],
+        'Is_Total': is_totals[keep]
+    }
+
+
+def extract_site_inv_settings(df, site_row, site_name, section_labels=None, verbose=False):
+    """Extract inventory settings for a single site (section_labels from find_section_labels)"""
+    return extract_inv_settings(df, [(site_row, site_name)], section_labels, verbose)
+
+
+def write_output(df_output, path):
+    """Write the settings to path: a Parquet file for a .parquet path, otherwise an Excel sheet"""
+    if path.endswith('.parquet'):
+        df_output.to_parquet(path, engine='pyarrow', compression='zstd', index=False)
+        return
+    
+    # xlsxwriter's constant_memory mode streams each row to disk as it is written instead of building
+    # the whole workbook in memory; without xlsxwriter installed, pandas' default engine is used
+    if importlib.util.find_spec('xlsxwriter') is None:
+        df_output.to_excel(path, index=False, sheet_name='Inv_Settings')
+        return
+    
+    with pd.ExcelWriter(path, engine='xlsxwriter', engine_kwargs={'options': {'constant_memory': True}}) as writer:
+        df_output.to_excel(writer, index=False, sheet_name='Inv_Settings')
+
+
+def banner(title):
+    """Print a section heading between two rules"""
+    print(f"{'='*80}\n{title}\n{'='*80}")
 
 
 def main():
     """Main execution"""
-    print("="*80)
-    print("STEP 4: EXTRACT INV SETTINGS (DESIRED TANK LEVELS)")
-    print("="*80)
-    
-    # Step 1: Fetch data
-    df = fetch_data()
+    banner("STEP 4: EXTRACT INV SETTINGS (DESIRED TANK LEVELS)")
     
-    # Step 2: Extract inventory settings for each site
-    all_records = []
+    # Step 1: Fetch data - only the rows up to the last site's section
+    df = fetch_data(max((site_row for site_row, _ in SITES), default=0) + SITE_SPAN)
     
-    for site_row, site_name in SITES:
-        records = extract_site_inv_settings(df, site_row, site_name)
-        all_records.extend(records)
+    # Step 2: Extract inventory settings for every site in one pass
+    print("\nExtracting INV. SETTING sections...")
+    records = extract_inv_settings(df, SITES, verbose=VERBOSE)
     
-    # Step 3: Convert to DataFrame
+    # Step 3: Convert to DataFrame - straight from the extracted columns, which are already
+    # sorted by Site, Product, Tank_Number
     print(f"\n{'='*80}")
     print(f"Creating final dataset...")
-    df_output = pd.DataFrame(all_records)
-    
-    # Sort by Site, Product, Tank_Number
-    df_output = df_output.sort_values(['Site', 'Product', 'Tank_Number'])
+    df_output = pd.DataFrame(records)
     
     print(f"Total records: {len(df_output)}")
     print(f"Columns: {list(df_output.columns)}")
     
-    # Step 4: Export to Excel
+    # Step 4: Export to Excel (or Parquet)
     print(f"\nExporting to: {OUTPUT_FILE}")
-    df_output.to_excel(OUTPUT_FILE, index=False, sheet_name='Inv_Settings')
+    write_output(df_output, OUTPUT_FILE)
     
-    # Display full output
-    print("\n" + "="*80)
-    print("COMPLETE INV SETTINGS REFERENCE:")
-    print("="*80)
-    print(df_output.to_string(index=False))
+    # Display full output, only on request - the exported file has every row
+    if SHOW_TABLE:
+        print()
+        banner("COMPLETE INV SETTINGS REFERENCE:")
+        print(df_output.to_string(index=False))
     
     # Summary by site
-    print("\n" + "="*80)
-    print("SUMMARY BY SITE:")
-    print("="*80)
-    for site in df_output['Site'].unique():
-        site_data = df_output[df_output['Site'] == site]
-        print(f"\n{site}:")
-        for product in ['87', '91', 'dsl']:
-            product_data = site_data[site_data['Product'] == product]
-            if len(product_data) > 0:
-                total_desired = product_data['Desired_Level'].sum()
-                tank_count = len(product_data)
-                print(f"  {product}: {tank_count} tank(s), Total desired level: {total_desired:,.0f} gallons")
-    
-    print("\n" + "="*80)
-    print("SUCCESS!")
-    print("="*80)
+    print()
+    banner("SUMMARY BY SITE:")
+    # One groupby pass; df_output is already sorted by Site and Product, so keep that order
+    summary = df_output.groupby(['Site', 'Product'], sort=False)['Desired_Level'].agg(['size', 'sum'])
+    current_site = None
+    for (site, product), tank_count, total_desired in summary.itertuples(name=None):
+        if site != current_site:
+            print(f"\n{site}:")
+            current_site = site
+        print(f"  {product}: {tank_count} tank(s), Total desired level: {total_desired:,.0f} gallons")
+    
+    print()
+    banner("SUCCESS!")
     print(f"Output saved to: {OUTPUT_FILE}")
     print(f"Total sites: {len(SITES)}")
     print(f"Total settings: {len(df_output)}")
     
-    print("\n" + "="*80)
-    print("ALL 4 DATASETS COMPLETE!")
-    print("="*80)
+    print()
+    banner("ALL 4 DATASETS COMPLETE!")
     print("1. Step1_Sept2025_Readings.xlsx    - Daily tank readings")
     print("2. Step2_Sept2025_Ullage.xlsx      - Daily ullage (empty space)")
     print("3. Step3_Tank_Sizes.xlsx            - Tank capacities")